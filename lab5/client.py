@@ -1,22 +1,416 @@
+import json
 import socket
+import select
+import threading
+import time
+from itertools import count
 from argparse import ArgumentParser
+from collections import deque, namedtuple
 import os
 from urllib.parse import urlparse
 
+Response = namedtuple("Response", ["status", "reason", "version", "headers", "body"])
+
+# Повторно отправлять после обрыва соединения можно только идемпотентные запросы
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
 
 def create_request(method, path, headers, body=""):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
     request_line = f"{method} {path} HTTP/1.1"
     headers["Host"] = headers.get("Host", "127.0.0.1")
+    # Без Content-Length сервер не узнает, где заканчивается тело
+    if body or method in ("POST", "PUT"):
+        headers.setdefault("Content-Length", str(len(body)))
     header_lines = "\r\n".join(f"{key}: {value}" for key, value in headers.items())
-    return f"{request_line}\r\n{header_lines}\r\n\r\n{body}"
+    return f"{request_line}\r\n{header_lines}\r\n\r\n".encode("utf-8") + body
+
+
+class HTTPConnection:
+    def __init__(self, host, port, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = bytearray()
+        self.pos = 0
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def is_stale(self):
+        # Простаивающее соединение, которое сервер уже закрыл, становится читаемым
+        if self.pos < len(self.buffer):
+            return True
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        if not readable:
+            return False
+        try:
+            return not self.sock.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def fill(self):
+        if self.pos and self.pos == len(self.buffer):
+            self.buffer.clear()
+            self.pos = 0
+        data = self.sock.recv(65536)
+        if not data:
+            raise ConnectionError("Connection closed by server")
+        self.buffer += data
+
+    def read_until(self, delimiter, limit=65536):
+        while True:
+            end = self.buffer.find(delimiter, self.pos)
+            if end >= 0:
+                data = bytes(self.buffer[self.pos:end])
+                self.pos = end + len(delimiter)
+                return data
+            if len(self.buffer) - self.pos > limit:
+                raise ValueError("Response header line too long")
+            self.fill()
+
+    def read_exact(self, size):
+        available = len(self.buffer) - self.pos
+        if available >= size:
+            data = bytes(self.buffer[self.pos:self.pos + size])
+            self.pos += size
+            return data
+        # Остаток тела читаем сразу в итоговый буфер, без промежуточных копий
+        body = bytearray(size)
+        body[:available] = self.buffer[self.pos:]
+        self.buffer.clear()
+        self.pos = 0
+        view = memoryview(body)
+        received = available
+        while received < size:
+            count = self.sock.recv_into(view[received:], size - received)
+            if not count:
+                raise ConnectionError("Connection closed before the end of the response body")
+            received += count
+        return bytes(body)
+
+    def read_to_close(self):
+        chunks = [bytes(self.buffer[self.pos:])]
+        self.buffer.clear()
+        self.pos = 0
+        while True:
+            data = self.sock.recv(65536)
+            if not data:
+                return b"".join(chunks)
+            chunks.append(data)
+
+    def read_chunked(self):
+        chunks = []
+        while True:
+            size_line = self.read_until(b"\r\n")
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if not size:
+                break
+            chunks.append(self.read_exact(size))
+            if self.read_exact(2) != b"\r\n":
+                raise ValueError("Invalid chunk terminator")
+        # Трейлеры не используются, но их нужно дочитать до пустой строки
+        while self.read_until(b"\r\n"):
+            pass
+        return b"".join(chunks)
+
+    def read_response(self, method="GET"):
+        while True:
+            head = self.read_until(b"\r\n\r\n").decode("latin-1")
+            lines = head.split("\r\n")
+            version, status, reason = (lines[0].split(" ", 2) + [""])[:3]
+            status = int(status)
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                name = name.strip().lower()
+                headers[name] = f"{headers[name]}, {value.strip()}" if name in headers else value.strip()
+            # Промежуточные ответы (100 Continue) пропускаем
+            if status >= 200 or status == 101:
+                break
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = "keep-alive" in connection
+        else:
+            keep_alive = "close" not in connection
+
+        if method == "HEAD" or status in (204, 304):
+            body = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            body = self.read_chunked()
+        elif "content-length" in headers:
+            body = self.read_exact(int(headers["content-length"]))
+        else:
+            body = self.read_to_close()
+            keep_alive = False
+        return Response(status, reason, version, headers, body), keep_alive
+
+    def close(self):
+        self.sock.close()
+
+
+class ConnectionPool:
+    def __init__(self, host, port, max_idle=4, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                return HTTPConnection(self.host, self.port, self.timeout), False
+            if not conn.is_stale():
+                return conn, True
+            conn.close()
+
+    def release(self, conn):
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            while self.idle:
+                self.idle.pop().close()
+
+
+class HTTPClient:
+    def __init__(self, max_idle=4, timeout=10.0):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def pool(self, host, port):
+        with self.lock:
+            pool = self.pools.get((host, port))
+            if pool is None:
+                pool = self.pools[(host, port)] = ConnectionPool(host, port, self.max_idle, self.timeout)
+            return pool
+
+    def request(self, method, host, port, path, headers=None, body=b""):
+        request = create_request(method, path, dict(headers or {}), body)
+        pool = self.pool(host, port)
+        while True:
+            conn, reused = pool.acquire()
+            try:
+                conn.send(request)
+                response, keep_alive = conn.read_response(method)
+            except OSError:
+                conn.close()
+                # Сервер мог закрыть переиспользованное соединение: повторяем на новом
+                if reused and method in IDEMPOTENT_METHODS:
+                    continue
+                raise
+            if keep_alive:
+                pool.release(conn)
+            else:
+                conn.close()
+            return response
+
+    def pipeline(self, host, port, requests, depth=16):
+        # requests - список (method, path, headers, body); ответы возвращаются в том же порядке
+        pending = deque(
+            (method, create_request(method, path, dict(headers or {}), body or b""))
+            for method, path, headers, body in requests
+        )
+        pool = self.pool(host, port)
+        responses = []
+        while pending:
+            conn, reused = pool.acquire()
+            batch = [pending[i] for i in range(min(depth, len(pending)))]
+            keep_alive = True
+            try:
+                conn.send(b"".join(request for _, request in batch))
+                for method, _ in batch:
+                    response, keep_alive = conn.read_response(method)
+                    responses.append(response)
+                    pending.popleft()
+                    if not keep_alive:
+                        break
+            except OSError:
+                conn.close()
+                if reused and pending[0][0] in IDEMPOTENT_METHODS:
+                    continue
+                raise
+            if keep_alive:
+                pool.release(conn)
+            else:
+                # Неотвеченные запросы пакета отправятся заново на новом соединении
+                conn.close()
+        return responses
+
+    def close(self):
+        with self.lock:
+            pools = list(self.pools.values())
+            self.pools.clear()
+        for pool in pools:
+            pool.close()
+
+
+def format_response(response):
+    status_line = f"{response.version} {response.status} {response.reason}"
+    header_lines = "\r\n".join(f"{key}: {value}" for key, value in response.headers.items())
+    return f"{status_line}\r\n{header_lines}\r\n\r\n{response.body.decode('utf-8', errors='replace')}"
 
 
 def send_request(host, port, request):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((host, port))
-        s.sendall(request.encode("utf-8"))
-        response = s.recv(4096).decode("utf-8")
-    return response
+    if isinstance(request, str):
+        request = request.encode("utf-8")
+    conn = HTTPConnection(host, port)
+    try:
+        conn.send(request)
+        response, _ = conn.read_response(request.split(b" ", 1)[0].decode("ascii"))
+    finally:
+        conn.close()
+    return format_response(response)
+
+
+# Границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+
+def read_mix(mix_file):
+    # Строки файла: МЕТОД ПУТЬ [ФАЙЛ_ТЕЛА]
+    mix = []
+    with open(mix_file, "r") as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            body = b""
+            if len(fields) > 2:
+                with open(fields[2], "rb") as body_file:
+                    body = body_file.read()
+            mix.append((fields[0].upper(), fields[1], body))
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+# Число запросов в режиме --bench, если не заданы ни -n, ни --duration
+BENCH_REQUESTS = 1000
+
+
+def run_benchmark(host, port, mix, headers=None, concurrency=10, duration=None, total=None, timeout=10.0):
+    # Запросы заранее сериализуются, чтобы измерять сервер, а не сборку запроса
+    requests = [(method, create_request(method, path, dict(headers or {}), body)) for method, path, body in mix]
+    counter = count()
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def worker():
+        latencies = []
+        statuses = {}
+        received = errors = 0
+        conn = None
+        while True:
+            number = next(counter)
+            if total is not None and number >= total:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            method, request = requests[number % len(requests)]
+            started = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = HTTPConnection(host, port, timeout)
+                conn.send(request)
+                response, keep_alive = conn.read_response(method)
+            except (OSError, ValueError):
+                errors += 1
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+            received += len(response.body)
+            if not keep_alive:
+                conn.close()
+                conn = None
+        if conn is not None:
+            conn.close()
+        with lock:
+            results.append((latencies, statuses, received, errors))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    statuses = {}
+    for _, result_statuses, _, _ in results:
+        for status, number in result_statuses.items():
+            statuses[status] = statuses.get(status, 0) + number
+    received = sum(result[2] for result in results)
+    histogram = {}
+    bucket_index = 0
+    for latency in latencies:
+        while bucket_index < len(LATENCY_BUCKETS) and latency > LATENCY_BUCKETS[bucket_index]:
+            bucket_index += 1
+        label = f"<={LATENCY_BUCKETS[bucket_index]}" if bucket_index < len(LATENCY_BUCKETS) else f">{LATENCY_BUCKETS[-1]}"
+        histogram[label] = histogram.get(label, 0) + 1
+    return {
+        "requests": len(latencies),
+        "errors": sum(result[3] for result in results),
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "bytes_per_s": round(received / elapsed, 1) if elapsed else 0.0,
+        "statuses": {str(status): number for status, number in sorted(statuses.items())},
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p90": round(percentile(latencies, 0.90), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+        "histogram_ms": histogram,
+    }
+
+
+def format_benchmark(stats):
+    latency = stats["latency_ms"]
+    lines = [
+        f"Requests:      {stats['requests']} ({stats['errors']} errors) in {stats['duration_s']} s"
+        f" with {stats['concurrency']} connections",
+        f"Requests/sec:  {stats['requests_per_s']}",
+        f"Bytes/sec:     {stats['bytes_per_s']}",
+        f"Statuses:      {', '.join(f'{status}: {number}' for status, number in stats['statuses'].items())}",
+        f"Latency ms:    p50 {latency['p50']}  p90 {latency['p90']}  p99 {latency['p99']}  max {latency['max']}",
+        "Histogram ms:",
+    ]
+    largest = max(stats["histogram_ms"].values(), default=0)
+    for label, number in stats["histogram_ms"].items():
+        bar = "#" * (int(40 * number / largest) if largest else 0)
+        lines.append(f"  {label:>8} {number:>8} {bar}")
+    return "\n".join(lines)
 
 
 def read_template(template_file):
@@ -31,7 +425,18 @@ if __name__ == "__main__":
     parser.add_argument("-H", "--headers", nargs="+", help="Headers as key:value")
     parser.add_argument("-b", "--body", help="Request body or path to file")
     parser.add_argument("-t", "--template", help="Template file for request")
+    parser.add_argument("-n", "--repeat", type=int,
+                        help=f"Send the request N times over pooled connections (default 1, {BENCH_REQUESTS} with --bench)")
+    parser.add_argument("--pipeline", action="store_true", help="Pipeline repeated requests on one connection")
+    parser.add_argument("-o", "--output", help="Write the last response body to a file")
+    parser.add_argument("--bench", action="store_true", help="Run a load benchmark instead of a single request")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="Benchmark: concurrent connections")
+    parser.add_argument("--duration", type=float, help="Benchmark: run for S seconds instead of -n requests")
+    parser.add_argument("--mix", help="Benchmark: file with 'METHOD PATH [BODY_FILE]' lines to cycle through")
+    parser.add_argument("--json", action="store_true", help="Benchmark: print results as JSON")
     args = parser.parse_args()
+    if args.repeat is None:
+        args.repeat = BENCH_REQUESTS if args.bench else 1
 
     url = args.url
     parsed_url = urlparse(f'http://{url}')  # Добавляем http://, чтобы urlparse мог корректно разобрать строку
@@ -41,11 +446,11 @@ if __name__ == "__main__":
 
     headers = {}
     if args.headers:
-        headers = dict(h.split(":", 1) for h in args.headers)
+        headers = {key.strip(): value.strip() for key, value in (h.split(":", 1) for h in args.headers)}
 
     body = args.body
     if body and os.path.exists(body):
-        with open(body, "r") as f:
+        with open(body, "rb") as f:
             body = f.read()
 
     # Используем шаблон, если он указан
@@ -53,6 +458,25 @@ if __name__ == "__main__":
         body = read_template(args.template)
         print(f"Using template from {args.template} for body.")  # Выводим в консоль, что используем шаблон
 
-    request = create_request(args.method, path, headers, body or "")
-    response = send_request(host, port, request)
-    print(f"Response:\n{response}")
+    if args.bench:
+        mix = read_mix(args.mix) if args.mix else [(args.method.upper(), path, body or b"")]
+        total = None if args.duration else args.repeat
+        stats = run_benchmark(host, port, mix, headers, args.concurrency, args.duration, total)
+        print(json.dumps(stats, indent=2) if args.json else format_benchmark(stats))
+    else:
+        with HTTPClient() as client:
+            if args.pipeline:
+                responses = client.pipeline(host, port, [(args.method, path, headers, body)] * args.repeat)
+            else:
+                responses = [client.request(args.method, host, port, path, headers, body or b"")
+                             for _ in range(args.repeat)]
+
+        response = responses[-1]
+        if args.repeat > 1:
+            print(f"Received {len(responses)} responses")
+        if args.output:
+            with open(args.output, "wb") as f:
+                f.write(response.body)
+            print(f"Saved {len(response.body)} bytes to {args.output}")
+            response = response._replace(body=b"")
+        print(f"Response:\n{format_response(response)}")
@@ -1,7 +1,21 @@
 import os
+import errno
+import gzip
+import mmap
 import socket
 import logging
+import logging.handlers
+import queue
+import random
+import selectors
+import signal
+import sys
+import threading
+import time
 from argparse import ArgumentParser
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
 import mimetypes
 
 DEFAULT_HEADERS = {
@@ -13,66 +27,745 @@ DEFAULT_HEADERS = {
 HTTP_STATUS_MESSAGES = {
     200: "OK",
     204: "No Content",
+    206: "Partial Content",
+    304: "Not Modified",
     400: "Bad Request",
     403: "Forbidden",
     404: "Not Found",
     405: "Method Not Allowed",
+    413: "Payload Too Large",
+    416: "Range Not Satisfiable",
+    431: "Request Header Fields Too Large",
     500: "Internal Server Error",
 }
 
 
 def create_response(status_code, headers=None, body=b""):
-    headers = headers or {}
+    headers = dict(headers or {})
+    # Без Content-Length клиент не сможет переиспользовать соединение
+    if status_code != 304:
+        headers.setdefault("Content-Length", str(len(body)))
     status_line = f"HTTP/1.1 {status_code} {HTTP_STATUS_MESSAGES.get(status_code, 'Unknown')}"
     header_lines = "\r\n".join([f"{key}: {value}" for key, value in headers.items()])
     return f"{status_line}\r\n{header_lines}\r\n\r\n".encode("utf-8") + body
 
 
-def handle_request(request, base_dir, log):
+def add_headers(response, headers):
+    # Вставляем заголовки сразу после строки статуса готового ответа
+    status_end = response.index(b"\r\n") + 2
+    header_lines = "".join(f"{key}: {value}\r\n" for key, value in headers.items()).encode("utf-8")
+    return response[:status_end] + header_lines + response[status_end:]
+
+
+Request = namedtuple("Request", ["method", "path", "version", "headers", "body"])
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RequestParser:
+    # Разбирает поток байтов соединения на запросы по мере поступления данных
+    def __init__(self, max_header_size=65536, max_body_size=10 * 1024 * 1024):
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.buffer = bytearray()
+        self.pos = 0
+        self.scan_from = 0
+        self.expect_continue = False
+        self.reset()
+
+    def reset(self):
+        self.state = "head"
+        self.head = None
+        self.body = None
+        self.remaining = 0
+
+    def feed(self, data):
+        # Сдвигаем буфер только когда разобранная часть стала большой, чтобы не копировать его на каждом запросе
+        if self.pos and (self.pos == len(self.buffer) or self.pos > 65536):
+            del self.buffer[:self.pos]
+            self.scan_from = max(self.scan_from - self.pos, 0)
+            self.pos = 0
+        self.buffer += data
+
+    def buffered(self):
+        return len(self.buffer) - self.pos
+
+    def next_request(self):
+        while True:
+            if self.state == "head":
+                if not self.parse_head():
+                    return None
+            elif self.state == "body":
+                if self.buffered() < self.remaining:
+                    return None
+                self.body = bytes(self.buffer[self.pos:self.pos + self.remaining])
+                self.pos += self.remaining
+                self.state = "done"
+            elif self.state == "chunk_size":
+                if not self.parse_chunk_size():
+                    return None
+            elif self.state == "chunk_data":
+                if self.buffered() < self.remaining + 2:
+                    return None
+                end = self.pos + self.remaining
+                if self.buffer[end:end + 2] != b"\r\n":
+                    raise HTTPError(400, "Invalid chunk terminator")
+                self.body += self.buffer[self.pos:end]
+                self.pos = end + 2
+                self.state = "chunk_size"
+            elif self.state == "trailers":
+                if self.buffer[self.pos:self.pos + 2] == b"\r\n":
+                    self.pos += 2
+                else:
+                    end = self.buffer.find(b"\r\n\r\n", self.pos)
+                    if end < 0:
+                        return None
+                    self.pos = end + 4
+                self.body = bytes(self.body)
+                self.state = "done"
+            else:
+                method, path, version, headers = self.head
+                request = Request(method, path, version, headers, self.body)
+                self.scan_from = self.pos
+                self.reset()
+                return request
+
+    def parse_head(self):
+        head_end = self.buffer.find(b"\r\n\r\n", max(self.scan_from, self.pos))
+        if head_end < 0:
+            if self.buffered() > self.max_header_size:
+                raise HTTPError(431, "Request headers too large")
+            # Продолжим поиск с места, где остановились, а не с начала буфера
+            self.scan_from = max(len(self.buffer) - 3, self.pos)
+            return False
+        if head_end - self.pos > self.max_header_size:
+            raise HTTPError(431, "Request headers too large")
+
+        lines = self.buffer[self.pos:head_end].decode("latin-1").split("\r\n")
+        self.pos = head_end + 4
+        # Пустые строки перед запросом допускаются RFC 9112
+        while lines and not lines[0]:
+            lines.pop(0)
+        parts = lines[0].split(" ") if lines else []
+        if len(parts) != 3:
+            raise HTTPError(400, "Malformed request line")
+        method, path, version = parts
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise HTTPError(400, "Malformed header line")
+            name = name.strip().lower()
+            value = value.strip()
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+        self.head = (method, path, version, headers)
+        self.body = b""
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            self.body = bytearray()
+            self.state = "chunk_size"
+        else:
+            try:
+                self.remaining = int(headers.get("content-length") or 0)
+            except ValueError:
+                raise HTTPError(400, "Invalid Content-Length")
+            if self.remaining < 0:
+                raise HTTPError(400, "Invalid Content-Length")
+            if self.remaining > self.max_body_size:
+                raise HTTPError(413, "Request body too large")
+            self.state = "body" if self.remaining else "done"
+        if self.state != "done" and headers.get("expect", "").lower() == "100-continue":
+            self.expect_continue = True
+        return True
+
+    def parse_chunk_size(self):
+        line_end = self.buffer.find(b"\r\n", self.pos)
+        if line_end < 0:
+            if self.buffered() > 1024:
+                raise HTTPError(400, "Invalid chunk size line")
+            return False
+        size_line = self.buffer[self.pos:line_end].split(b";", 1)[0].strip()
+        try:
+            size = int(size_line, 16)
+        except ValueError:
+            raise HTTPError(400, "Invalid chunk size")
+        if size < 0:
+            raise HTTPError(400, "Invalid chunk size")
+        if len(self.body) + size > self.max_body_size:
+            raise HTTPError(413, "Request body too large")
+        self.pos = line_end + 2
+        self.remaining = size
+        self.state = "chunk_data" if size else "trailers"
+        return True
+
+
+def wants_keep_alive(version, headers):
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.0":
+        return "keep-alive" in connection
+    return "close" not in connection
+
+
+def finalize_response(response, version, keep_alive, keep_alive_timeout, max_requests):
+    # Ответ - либо готовые байты, либо список частей: заголовки и файловые фрагменты
+    parts = response if isinstance(response, list) else [response]
+    if not keep_alive:
+        parts[0] = add_headers(parts[0], {"Connection": "close"})
+    elif version == "HTTP/1.0":
+        parts[0] = add_headers(parts[0], {
+            "Connection": "keep-alive",
+            "Keep-Alive": f"timeout={int(keep_alive_timeout)}, max={max_requests}",
+        })
+    return parts
+
+
+class FilePart:
+    # Фрагмент файла, который отправляется напрямую из ядра без чтения в память процесса
+    SENDFILE_CHUNK = 1024 * 1024
+
+    def __init__(self, file, offset, count, owns_file=True):
+        self.file = file
+        self.offset = offset
+        self.count = count
+        # Несколько фрагментов одного файла (multipart/byteranges) закрывают его один раз
+        self.owns_file = owns_file
+        self.mmap = None
+        self.window = 0
+        self.use_sendfile = hasattr(os, "sendfile")
+
+    def send(self, sock):
+        size = min(self.count, self.SENDFILE_CHUNK)
+        sent = None
+        if self.use_sendfile:
+            try:
+                sent = os.sendfile(sock.fileno(), self.file.fileno(), self.offset, size)
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP):
+                    raise
+                # Файловая система или сокет не поддерживают sendfile: отправляем из отображения файла
+                self.use_sendfile = False
+        if sent is None:
+            # Отображаем файл окнами, чтобы память на загрузку не росла с размером файла
+            if self.mmap is None or not self.window <= self.offset < self.window + len(self.mmap):
+                if self.mmap is not None:
+                    self.mmap.close()
+                self.window = self.offset - self.offset % mmap.ALLOCATIONGRANULARITY
+                length = self.offset + self.count - self.window
+                self.mmap = mmap.mmap(self.file.fileno(), min(length, self.SENDFILE_CHUNK),
+                                      access=mmap.ACCESS_READ, offset=self.window)
+            start = self.offset - self.window
+            with memoryview(self.mmap) as view:
+                sent = sock.send(view[start:start + size])
+        if sent == 0 and size:
+            # Файл укоротился во время отправки: дальше отправлять нечего
+            raise OSError(errno.EPIPE, "File truncated while sending")
+        self.offset += sent
+        self.count -= sent
+        return sent
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        if self.owns_file:
+            self.file.close()
+
+
+def close_parts(parts):
+    for part in parts:
+        if isinstance(part, FilePart):
+            part.close()
+
+
+def send_parts(sock, parts):
+    try:
+        for part in parts:
+            if isinstance(part, FilePart):
+                if part.count:
+                    sock.sendfile(part.file, part.offset, part.count)
+            else:
+                sock.sendall(part)
+    finally:
+        close_parts(parts)
+
+
+class CacheEntry:
+    def __init__(self, file_path, response, mime_type, mtime, size, sidecars):
+        self.file_path = file_path
+        self.response = response
+        # Тело - срез готового ответа без копирования, иначе файл хранился бы в памяти дважды
+        self.body = memoryview(response)[len(response) - size:]
+        self.mime_type = mime_type
+        self.mtime = mtime
+        self.size = size
+        self.sidecars = sidecars
+        # Сжатые варианты ответа по кодировкам хранятся рядом с обычным ответом
+        self.variants = {}
+        self.nbytes = len(response)
+        self.etag, self.last_modified = file_validators(mtime, size)
+        self.checked_at = time.monotonic()
+
+
+class StaticCache:
+    # Файлы крупнее этого размера всегда отдаются через sendfile
+    MAX_FILE_SIZE = 1024 * 1024
+
+    def __init__(self, max_bytes, max_entries, check_interval=1.0):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self.max_file_size = min(self.MAX_FILE_SIZE, max_bytes)
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+        # Файл на диске проверяем не чаще check_interval, остальные запросы обходятся без системных вызовов
+        now = time.monotonic()
+        if now - entry.checked_at < self.check_interval:
+            return entry
+        try:
+            stat = os.stat(entry.file_path)
+        except OSError:
+            stat = None
+        if stat is None or stat.st_mtime_ns != entry.mtime or stat.st_size != entry.size:
+            self.remove(key, entry)
+            return None
+        entry.checked_at = now
+        return entry
+
+    def put(self, key, entry):
+        if entry.nbytes > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.nbytes
+            self.entries[key] = entry
+            self.total_bytes += entry.nbytes
+            self.evict()
+
+    def add_variant(self, key, entry, encoding, response):
+        with self.lock:
+            if self.entries.get(key) is not entry or encoding in entry.variants:
+                return
+            entry.variants[encoding] = response
+            entry.nbytes += len(response)
+            self.total_bytes += len(response)
+            self.evict()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes or len(self.entries) > self.max_entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= evicted.nbytes
+
+    def remove(self, key, entry):
+        with self.lock:
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+                self.total_bytes -= entry.nbytes
+
+
+# Больше диапазонов в одном запросе не обслуживаем: отдаём файл целиком
+MAX_RANGES = 16
+
+
+def file_validators(mtime_ns, size):
+    etag = f'"{mtime_ns:x}-{size:x}"'
+    last_modified = formatdate(mtime_ns / 1e9, usegmt=True)
+    return etag, last_modified
+
+
+def is_not_modified(headers, etag, mtime_ns):
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return mtime_ns // 1_000_000_000 <= since
+    return False
+
+
+def parse_range(value, size):
+    # Возвращает список диапазонов (начало, конец) включительно; None - заголовок игнорируется
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    for item in spec.split(","):
+        start, sep, end = item.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start:
+                first = int(start)
+                last = int(end) if end else size - 1
+                # Обратный диапазон недопустим только при явном конце; "bytes=1000-" для
+                # файла короче 1000 байт ниже отбрасывается как неудовлетворимый (416)
+                if end and last < first:
+                    return None
+            else:
+                suffix = int(end)
+                if not suffix:
+                    continue
+                first, last = max(size - suffix, 0), size - 1
+        except ValueError:
+            return None
+        if first < size:
+            ranges.append((first, min(last, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+# Кодировки в порядке предпочтения сервера; br отдаётся только из заранее сжатых файлов
+SIDECAR_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml")
+COMPRESS_MIN_SIZE = 256
+COMPRESS_MAX_SIZE = 1024 * 1024
+
+
+def is_compressible(mime_type, size):
+    return COMPRESS_MIN_SIZE <= size <= COMPRESS_MAX_SIZE and mime_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def find_sidecars(file_path, mtime_ns):
+    sidecars = {}
+    for encoding, extension in SIDECAR_EXTENSIONS.items():
+        try:
+            stat = os.stat(file_path + extension)
+        except OSError:
+            continue
+        # Сжатая копия старше исходного файла считается устаревшей
+        if stat.st_mtime_ns >= mtime_ns:
+            sidecars[encoding] = file_path + extension
+    return sidecars
+
+
+def choose_encoding(accept_encoding, available):
+    preferences = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.strip().split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        preferences[coding.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = preferences.get(encoding, preferences.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def not_modified_response(etag, last_modified):
+    headers = {"ETag": etag, "Last-Modified": last_modified, "Vary": "Accept-Encoding"}
+    headers.update(DEFAULT_HEADERS)
+    return create_response(304, headers)
+
+
+def serve_file(request, base_dir, cache=None):
+    cache_key = file_path = os.path.join(base_dir, request.path.strip("/"))
+    entry = cache.get(cache_key) if cache is not None else None
+    f = None
+    sidecars = None
+    if entry is not None:
+        mime_type, mtime, size, body = entry.mime_type, entry.mtime, entry.size, entry.body
+        etag, last_modified, sidecars = entry.etag, entry.last_modified, entry.sidecars
+    else:
+        if os.path.isdir(file_path):
+            file_path = os.path.join(file_path, "index.html")
+
+        if not os.path.exists(file_path):
+            return create_response(404, DEFAULT_HEADERS, b"File not found")
+
+        mime_type, _ = mimetypes.guess_type(file_path)
+        mime_type = mime_type or "application/octet-stream"
+
+        f = open(file_path, "rb")
+        try:
+            stat = os.fstat(f.fileno())
+        except OSError:
+            f.close()
+            raise
+        mtime, size = stat.st_mtime_ns, stat.st_size
+        etag, last_modified = file_validators(mtime, size)
+        body = None
+
+        # Небольшие файлы кэшируем целиком вместе с готовыми заголовками
+        if cache is not None and size <= cache.max_file_size:
+            with f:
+                body = f.read()
+            f = None
+            if len(body) == size:
+                headers = {
+                    "Content-Type": mime_type,
+                    "Content-Length": str(size),
+                    "ETag": etag,
+                    "Last-Modified": last_modified,
+                    "Accept-Ranges": "bytes",
+                    "Vary": "Accept-Encoding",
+                }
+                headers.update(DEFAULT_HEADERS)
+                sidecars = find_sidecars(file_path, mtime)
+                entry = CacheEntry(file_path, create_response(200, headers, body), mime_type, mtime, size, sidecars)
+                cache.put(cache_key, entry)
+            else:
+                size = len(body)
+
+    # Сжатие применяется только к полным ответам, диапазоны отдаются из исходного файла
+    encoding = None
+    accept_encoding = request.headers.get("accept-encoding")
+    range_header = request.headers.get("range")
+    if accept_encoding and not range_header:
+        if sidecars is None:
+            sidecars = find_sidecars(file_path, mtime)
+        available = [name for name in SIDECAR_EXTENSIONS
+                     if name in sidecars or (name == "gzip" and is_compressible(mime_type, size))]
+        encoding = choose_encoding(accept_encoding, available)
+
+    if encoding is not None:
+        variant_etag = f'{etag[:-1]}-{encoding}"'
+        if is_not_modified(request.headers, variant_etag, mtime):
+            if f is not None:
+                f.close()
+            return not_modified_response(variant_etag, last_modified)
+        response = entry.variants.get(encoding) if entry is not None else None
+        if response is not None:
+            return response
+
+        headers = {"Content-Type": mime_type, "Content-Encoding": encoding}
+        sidecar_path = sidecars.get(encoding)
+        if sidecar_path is not None:
+            if f is not None:
+                f.close()
+            sidecar = open(sidecar_path, "rb")
+            try:
+                sidecar_size = os.fstat(sidecar.fileno()).st_size
+            except OSError:
+                sidecar.close()
+                raise
+            if sidecar_size > COMPRESS_MAX_SIZE:
+                headers["Content-Length"] = str(sidecar_size)
+                headers.update({"ETag": variant_etag, "Last-Modified": last_modified, "Vary": "Accept-Encoding"})
+                headers.update(DEFAULT_HEADERS)
+                return [create_response(200, headers), FilePart(sidecar, 0, sidecar_size)]
+            with sidecar:
+                encoded = sidecar.read()
+        else:
+            if body is None:
+                with f:
+                    body = f.read()
+            encoded = gzip.compress(body, compresslevel=6, mtime=0)
+        headers["Content-Length"] = str(len(encoded))
+        headers.update({"ETag": variant_etag, "Last-Modified": last_modified, "Vary": "Accept-Encoding"})
+        headers.update(DEFAULT_HEADERS)
+        response = create_response(200, headers, encoded)
+        if entry is not None:
+            cache.add_variant(cache_key, entry, encoding, response)
+        return response
+
+    validators = {"ETag": etag, "Last-Modified": last_modified}
+    if is_not_modified(request.headers, etag, mtime):
+        if f is not None:
+            f.close()
+        return not_modified_response(etag, last_modified)
+
+    ranges = None
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range in (etag, last_modified)):
+        ranges = parse_range(range_header, size)
+
+    if ranges is None:
+        if entry is not None:
+            return entry.response
+        headers = {"Content-Type": mime_type, "Content-Length": str(size)}
+        headers.update(validators)
+        headers["Accept-Ranges"] = "bytes"
+        headers["Vary"] = "Accept-Encoding"
+        headers.update(DEFAULT_HEADERS)
+        if body is not None:
+            return create_response(200, headers, body)
+        # Тело не читаем: файл отправляется частями через sendfile
+        return [create_response(200, headers), FilePart(f, 0, size)]
+
+    if not ranges:
+        if f is not None:
+            f.close()
+        headers = {"Content-Range": f"bytes */{size}"}
+        headers.update(DEFAULT_HEADERS)
+        return create_response(416, headers)
+
+    def range_part(first, last, owns_file):
+        if body is not None:
+            return body[first:last + 1]
+        return FilePart(f, first, last - first + 1, owns_file)
+
+    headers = {"Accept-Ranges": "bytes", "Vary": "Accept-Encoding"}
+    headers.update(validators)
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        headers["Content-Type"] = mime_type
+        headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+        parts = [range_part(first, last, True)]
+    else:
+        boundary = os.urandom(12).hex()
+        headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+        parts = []
+        for index, (first, last) in enumerate(ranges):
+            part_head = f"\r\n--{boundary}\r\nContent-Type: {mime_type}\r\nContent-Range: bytes {first}-{last}/{size}\r\n\r\n"
+            parts.append(part_head.encode("utf-8"))
+            parts.append(range_part(first, last, index == len(ranges) - 1))
+        parts.append(f"\r\n--{boundary}--\r\n".encode("utf-8"))
+    headers["Content-Length"] = str(sum(part.count if isinstance(part, FilePart) else len(part) for part in parts))
+    headers.update(DEFAULT_HEADERS)
+    if body is not None:
+        return create_response(206, headers, b"".join(parts))
+    return [create_response(206, headers)] + parts
+
+
+class BatchFileHandler(logging.FileHandler):
+    # Копит строки и записывает их в файл пачкой одним вызовом write
+    def __init__(self, filename, batch_size=256):
+        super().__init__(filename, encoding="utf-8")
+        self.batch_size = batch_size
+        self.batch = []
+
+    def emit(self, record):
+        try:
+            self.batch.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.batch and self.stream is not None:
+                self.stream.write("".join(self.batch))
+                self.stream.flush()
+            self.batch.clear()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # Форматирование сообщения переносится в поток записи: аргументы записей неизменяемые
+    def prepare(self, record):
+        return record
+
+
+class AccessSampler(logging.Filter):
+    # Строки журнала доступа пропускаются с заданной вероятностью, предупреждения и ошибки - всегда
+    def __init__(self, sample_rate):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if self.sample_rate >= 1.0 or not getattr(record, "access", False):
+            return True
+        return random.random() < self.sample_rate
+
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    def __init__(self, log_queue, flush_interval, *handlers):
+        super().__init__(log_queue, *handlers)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        # Пока новых записей нет, периодически сбрасываем накопленную пачку на диск
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+
+def setup_logging(log_file, batch_size=256, flush_interval=1.0, sample_rate=1.0):
+    file_handler = BatchFileHandler(log_file, batch_size)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(AccessSampler(sample_rate))
+
+    log = logging.getLogger("HTTPServer")
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    log.addHandler(queue_handler)
+
+    listener = BatchQueueListener(log_queue, flush_interval, file_handler)
+    listener.start()
+    return log, listener
+
+
+def stop_logging(listener):
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def log_access(log, address, request, response, started):
+    if not log.isEnabledFor(logging.INFO):
+        return
+    parts = response if isinstance(response, list) else [response]
+    status = parts[0][9:12].decode("ascii")
+    size = sum(part.count if isinstance(part, FilePart) else len(part) for part in parts)
+    log.info("access client=%s:%s method=%s path=%s status=%s bytes=%d ms=%.2f",
+             address[0], address[1], request.method, request.path, status, size,
+             (time.perf_counter() - started) * 1000, extra={"access": True})
+
+
+def handle_request(request, base_dir, log, cache=None):
     try:
-        # Разбираем запрос
-        lines = request.split("\r\n")
-        method, path, _ = lines[0].split(" ")
-        log.info(f"Received {method} request for {path}")
+        method = request.method
 
         # Обрабатываем OPTIONS-запрос
         if method == "OPTIONS":
-            log.info(f"Received OPTIONS request for {path}")
             headers = {"Content-Length": "0"}
             headers.update(DEFAULT_HEADERS)
             return create_response(204, headers)
 
         # Обрабатываем GET-запрос
         if method == "GET":
-            file_path = os.path.join(base_dir, path.strip("/"))
-            if os.path.isdir(file_path):
-                file_path = os.path.join(file_path, "index.html")
-
-            if not os.path.exists(file_path):
-                return create_response(404, DEFAULT_HEADERS, b"File not found")
-
-            mime_type, _ = mimetypes.guess_type(file_path)
-            mime_type = mime_type or "application/octet-stream"
-
-            with open(file_path, "rb") as f:
-                body = f.read()
-
-            headers = {
-                "Content-Type": mime_type,
-                "Content-Length": str(len(body)),
-            }
-            headers.update(DEFAULT_HEADERS)
-            return create_response(200, headers, body)
+            return serve_file(request, base_dir, cache)
 
         # Обрабатываем POST-запрос
         if method == "POST":
-            body_start = request.find("\r\n\r\n") + 4
-            body = request[body_start:]
-            # Логируем тело запроса
-            log.info(f"POST body: {body}")
+            body = request.body
+            # Логируем размер тела запроса
+            log.info(f"POST body: {len(body)} bytes")
 
             # Пример обработки
-            response_body = f"POST received with body: {body}".encode("utf-8")
+            response_body = b"POST received with body: " + body
             headers = {"Content-Type": "text/plain", "Content-Length": str(len(response_body))}
             headers.update(DEFAULT_HEADERS)
             return create_response(200, headers, response_body)
@@ -85,28 +778,345 @@ def handle_request(request, base_dir, log):
         return create_response(500, DEFAULT_HEADERS, b"Internal Server Error")
 
 
-def start_server(host, port, base_dir, log_file):
-    logging.basicConfig(filename=log_file, level=logging.INFO, format="%(asctime)s - %(message)s")
-    log = logging.getLogger("HTTPServer")
-    log.info(f"Starting server on {host}:{port}, serving {base_dir}")
+def error_response(error):
+    message = str(error).encode("utf-8")
+    return add_headers(create_response(error.status_code, DEFAULT_HEADERS, message), {"Connection": "close"})
 
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.bind((host, port))
-    server_socket.listen(5)
 
-    print(f"Server running on http://{host}:{port}")
+CONTINUE_RESPONSE = b"HTTP/1.1 100 Continue\r\n\r\n"
+
+
+def serve_simple(server_socket, base_dir, log, read_timeout=5.0, max_header_size=65536,
+                 max_body_size=10 * 1024 * 1024, cache=None):
     while True:
         client_socket, client_address = server_socket.accept()
-        request = client_socket.recv(4096).decode("utf-8", errors="ignore")
-        if not request:
-            log.warning(f"Empty request from {client_address}")
+        client_socket.settimeout(read_timeout)
+        parser = RequestParser(max_header_size, max_body_size)
+        try:
+            serve_connection(client_socket, client_address, parser, base_dir, log, cache)
+        except OSError:
+            pass
+        finally:
             client_socket.close()
-            continue
 
-        print(f"Received request from {client_address}: {request.splitlines()[0]}")  # Вывод в консоль
-        response = handle_request(request, base_dir, log)
-        client_socket.sendall(response)
-        client_socket.close()
+
+def serve_connection(client_socket, client_address, parser, base_dir, log, cache=None):
+    # Последовательный движок обслуживает одно соединение за раз: держать его открытым
+    # значило бы заставить остальных клиентов ждать, поэтому отвечаем на один запрос и закрываем.
+    while True:
+        try:
+            request = parser.next_request()
+        except HTTPError as e:
+            log.warning(f"Bad request from {client_address}: {e}")
+            client_socket.sendall(error_response(e))
+            return
+        if request is not None:
+            break
+        if parser.expect_continue:
+            parser.expect_continue = False
+            client_socket.sendall(CONTINUE_RESPONSE)
+        data = client_socket.recv(65536)
+        if not data:
+            if not parser.buffered():
+                log.warning(f"Empty request from {client_address}")
+            return
+        parser.feed(data)
+
+    started = time.perf_counter()
+    response = handle_request(request, base_dir, log, cache)
+    log_access(log, client_address, request, response, started)
+    send_parts(client_socket, finalize_response(response, request.version, False, None, None))
+
+
+class Connection:
+    def __init__(self, sock, address, parser):
+        self.sock = sock
+        self.address = address
+        self.parser = parser
+        self.out = deque()
+        self.callback = None
+        self.events = 0
+        self.busy = False
+        self.closing = False
+        self.eof = False
+        self.served = 0
+        self.last_active = time.monotonic()
+
+
+class SelectorServer:
+    # Сколько ответов на конвейерные запросы копить в очереди отправки одного соединения
+    PIPELINE_DEPTH = 16
+    # Порог входного буфера, после которого перестаём читать, пока не разберём очередь
+    READ_LIMIT = 65536
+
+    def __init__(self, server_socket, base_dir, log, workers=0, keep_alive_timeout=5.0, max_requests=100,
+                 max_header_size=65536, max_body_size=10 * 1024 * 1024, cache=None):
+        self.server_socket = server_socket
+        self.base_dir = base_dir
+        self.log = log
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_requests = max_requests
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.cache = cache
+        self.selector = selectors.DefaultSelector()
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+        self.connections = set()
+        # Готовые ответы из пула потоков возвращаются в цикл через очередь и socketpair
+        self.done = deque()
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_recv.setblocking(False)
+        self.wakeup_send.setblocking(False)
+
+    def serve_forever(self):
+        self.server_socket.setblocking(False)
+        self.selector.register(self.server_socket, selectors.EVENT_READ, self.accept)
+        self.selector.register(self.wakeup_recv, selectors.EVENT_READ, self.drain_done)
+        last_sweep = time.monotonic()
+        try:
+            while True:
+                for key, mask in self.selector.select(timeout=1.0):
+                    key.data(key.fileobj, mask)
+                now = time.monotonic()
+                if now - last_sweep >= 1.0:
+                    self.close_idle(now)
+                    last_sweep = now
+        finally:
+            self.selector.close()
+            if self.executor:
+                self.executor.shutdown(wait=False)
+
+    def accept(self, server_socket, mask):
+        # Принимаем все ожидающие соединения за один проход
+        while True:
+            try:
+                client_socket, client_address = server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            client_socket.setblocking(False)
+            conn = Connection(client_socket, client_address, RequestParser(self.max_header_size, self.max_body_size))
+            conn.callback = lambda sock, mask, conn=conn: self.on_event(conn, mask)
+            self.connections.add(conn)
+            self.update_events(conn)
+
+    def close_idle(self, now):
+        for conn in list(self.connections):
+            if not conn.busy and not conn.out and now - conn.last_active > self.keep_alive_timeout:
+                self.close(conn)
+
+    def on_event(self, conn, mask):
+        conn.last_active = time.monotonic()
+        if mask & selectors.EVENT_WRITE:
+            self.on_writable(conn)
+        if mask & selectors.EVENT_READ and conn in self.connections:
+            self.on_readable(conn)
+
+    def on_readable(self, conn):
+        try:
+            data = conn.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            if not conn.served and not conn.parser.buffered():
+                self.log.warning(f"Empty request from {conn.address}")
+            # Клиент закрыл свою сторону: отвечаем на уже полученные запросы и закрываем
+            conn.eof = True
+            self.process(conn)
+            return
+
+        conn.parser.feed(data)
+        self.process(conn)
+
+    def process(self, conn):
+        while not conn.busy and not conn.closing and len(conn.out) < self.PIPELINE_DEPTH:
+            try:
+                request = conn.parser.next_request()
+            except HTTPError as e:
+                self.log.warning(f"Bad request from {conn.address}: {e}")
+                conn.out.append(memoryview(error_response(e)))
+                conn.closing = True
+                break
+            if request is None:
+                if conn.parser.expect_continue:
+                    conn.parser.expect_continue = False
+                    conn.out.append(memoryview(CONTINUE_RESPONSE))
+                if conn.eof:
+                    conn.closing = True
+                break
+
+            conn.served += 1
+            keep_alive = wants_keep_alive(request.version, request.headers) and conn.served < self.max_requests
+            if not keep_alive:
+                conn.closing = True
+            started = time.perf_counter()
+            if self.executor:
+                conn.busy = True
+                future = self.executor.submit(handle_request, request, self.base_dir, self.log, self.cache)
+                future.add_done_callback(
+                    lambda f, conn=conn, request=request, keep_alive=keep_alive, started=started:
+                    self.schedule_response(conn, f, request, keep_alive, started))
+            else:
+                response = handle_request(request, self.base_dir, self.log, self.cache)
+                self.queue_response(conn, request, response, keep_alive, started)
+        self.finish_or_wait(conn)
+
+    def schedule_response(self, conn, future, request, keep_alive, started):
+        # Вызывается из потока пула: передаём результат в цикл событий
+        self.done.append((conn, future, request, keep_alive, started))
+        try:
+            self.wakeup_send.send(b"\0")
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def drain_done(self, sock, mask):
+        try:
+            while sock.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        while self.done:
+            conn, future, request, keep_alive, started = self.done.popleft()
+            conn.busy = False
+            try:
+                response = future.result()
+            except Exception as e:
+                self.log.error(f"Error handling request: {e}")
+                response = create_response(500, DEFAULT_HEADERS, b"Internal Server Error")
+            if conn not in self.connections:
+                close_parts(response if isinstance(response, list) else [])
+                continue
+            self.queue_response(conn, request, response, keep_alive, started)
+            self.on_writable(conn)
+
+    def queue_response(self, conn, request, response, keep_alive, started):
+        log_access(self.log, conn.address, request, response, started)
+        finalized = finalize_response(response, request.version, keep_alive, self.keep_alive_timeout, self.max_requests)
+        for part in finalized:
+            conn.out.append(part if isinstance(part, FilePart) else memoryview(part))
+
+    def on_writable(self, conn):
+        while conn.out:
+            part = conn.out[0]
+            try:
+                if isinstance(part, FilePart):
+                    if part.count:
+                        part.send(conn.sock)
+                        continue
+                    part.close()
+                    conn.out.popleft()
+                    continue
+                sent = conn.sock.send(part)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                self.close(conn)
+                return
+            if sent < len(part):
+                conn.out[0] = part[sent:]
+                break
+            conn.out.popleft()
+        if not conn.out and not conn.closing:
+            # Очередь отправки освободилась: разбираем следующие конвейерные запросы
+            self.process(conn)
+        else:
+            self.finish_or_wait(conn)
+
+    def finish_or_wait(self, conn):
+        if conn.closing and not conn.busy and not conn.out:
+            self.close(conn)
+        else:
+            self.update_events(conn)
+
+    def update_events(self, conn):
+        events = 0
+        if not conn.closing and not conn.eof and (not (conn.busy or conn.out) or conn.parser.buffered() < self.READ_LIMIT):
+            events |= selectors.EVENT_READ
+        if conn.out:
+            events |= selectors.EVENT_WRITE
+        if events == conn.events:
+            return
+        if not conn.events:
+            self.selector.register(conn.sock, events, conn.callback)
+        elif not events:
+            self.selector.unregister(conn.sock)
+        else:
+            self.selector.modify(conn.sock, events, conn.callback)
+        conn.events = events
+
+    def close(self, conn):
+        if conn.events:
+            self.selector.unregister(conn.sock)
+            conn.events = 0
+        self.connections.discard(conn)
+        close_parts(conn.out)
+        conn.out.clear()
+        conn.sock.close()
+
+
+def fork_workers(processes):
+    # Каждый дочерний процесс обслуживает общий слушающий сокет
+    children = []
+    for _ in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            return []
+        children.append(pid)
+    return children
+
+
+def start_server(host, port, base_dir, log_file, engine="simple", backlog=5, workers=0, processes=1,
+                 keep_alive_timeout=5.0, max_requests=100, max_header_size=65536, max_body_size=10 * 1024 * 1024,
+                 cache_size=64 * 1024 * 1024, cache_entries=1024, cache_check_interval=1.0,
+                 log_batch_size=256, log_flush_interval=1.0, log_sample_rate=1.0):
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((host, port))
+    server_socket.listen(backlog)
+
+    print(f"Server running on http://{host}:{port}")
+    # Поток записи журнала запускается уже после fork: потоки не переживают fork
+    fork_available = hasattr(os, "fork")
+    children = []
+    if processes > 1 and fork_available:
+        children = fork_workers(processes)
+    is_worker = processes > 1 and fork_available and not children
+    log, listener = setup_logging(log_file, log_batch_size, log_flush_interval, log_sample_rate)
+    if not is_worker:
+        log.info(f"Starting server on {host}:{port}, serving {base_dir} with {engine} engine")
+    if processes > 1 and not fork_available:
+        log.warning("os.fork is not available, running a single process")
+    # По SIGTERM выходим штатно, чтобы дописать накопленный журнал
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        if children:
+            log.info(f"Started {processes} worker processes: {children}")
+            try:
+                for pid in children:
+                    os.waitpid(pid, 0)
+            finally:
+                for pid in children:
+                    try:
+                        os.kill(pid, signal.SIGTERM)
+                    except OSError:
+                        pass
+                server_socket.close()
+            return
+
+        cache = None
+        if cache_size > 0 and cache_entries > 0:
+            cache = StaticCache(cache_size, cache_entries, cache_check_interval)
+
+        if engine == "selector":
+            SelectorServer(server_socket, base_dir, log, workers, keep_alive_timeout, max_requests,
+                           max_header_size, max_body_size, cache).serve_forever()
+        else:
+            # Без keep-alive таймаут соединения ограничивает только ожидание запроса
+            serve_simple(server_socket, base_dir, log, keep_alive_timeout, max_header_size, max_body_size, cache)
+    finally:
+        stop_logging(listener)
 
 
 if __name__ == "__main__":
@@ -115,5 +1125,33 @@ if __name__ == "__main__":
     parser.add_argument("-P", "--port", type=int, default=8080, help="Server port")
     parser.add_argument("-d", "--dir", default="./static", help="Base directory for serving files")
     parser.add_argument("-l", "--log", default="server.log", help="Log file")
+    parser.add_argument("-e", "--engine", choices=["simple", "selector"], default="simple",
+                        help="Connection engine: sequential accept loop (one request per connection) or "
+                             "selectors event loop (required for keep-alive and pipelining)")
+    parser.add_argument("--backlog", type=int, default=5, help="Listen backlog")
+    parser.add_argument("-w", "--workers", type=int, default=0,
+                        help="Thread pool size for request handling (0 - handle in the event loop)")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--keep-alive-timeout", type=float, default=5.0,
+                        help="Seconds an idle persistent connection is kept open "
+                             "(simple engine: seconds to wait for the request)")
+    parser.add_argument("--max-requests", type=int, default=100,
+                        help="Maximum requests per connection (selector engine)")
+    parser.add_argument("--max-header-size", type=int, default=65536, help="Maximum request header size in bytes")
+    parser.add_argument("--max-body-size", type=int, default=10 * 1024 * 1024,
+                        help="Maximum request body size in bytes")
+    parser.add_argument("--cache-size", type=int, default=64 * 1024 * 1024,
+                        help="Static file cache size in bytes (0 - disable the cache)")
+    parser.add_argument("--cache-entries", type=int, default=1024, help="Maximum number of cached files")
+    parser.add_argument("--cache-check-interval", type=float, default=1.0,
+                        help="Seconds between mtime/size checks of a cached file")
+    parser.add_argument("--log-batch-size", type=int, default=256, help="Log lines written to disk in one batch")
+    parser.add_argument("--log-flush-interval", type=float, default=1.0,
+                        help="Seconds after which a partial log batch is written")
+    parser.add_argument("--log-sample-rate", type=float, default=1.0,
+                        help="Fraction of access log lines to keep (errors are always logged)")
     args = parser.parse_args()
-    start_server(args.host, args.port, args.dir, args.log)
+    start_server(args.host, args.port, args.dir, args.log, args.engine, args.backlog, args.workers, args.processes,
+                 args.keep_alive_timeout, args.max_requests, args.max_header_size, args.max_body_size,
+                 args.cache_size, args.cache_entries, args.cache_check_interval,
+                 args.log_batch_size, args.log_flush_interval, args.log_sample_rate)
@@ -0,0 +1,393 @@
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.http import generate_etag, parse_etags
+from urllib.parse import urlencode
+import os
+
+# The models, field maps and bulk planning are shared with the Flask app;
+# only the request handling and database access are asynchronous here.
+from rest_api import (
+    Author, Book, Category, Publisher,
+    BOOK_DEFAULT_FIELDS, BOOK_FIELDS, BOOK_FILTERS, BOOK_JOINS,
+    BULK_DEPENDENTS, BUNDLE_COLLECTIONS, CACHE_WRITES, DETAIL_FIELDS, NAMED_FIELDS, NAMED_FILTERS, SEARCH_TYPES,
+    app as flask_app, chunked, dumps_json, engine_options, invalidate, plan_bulk_upsert, reset_id_sequence,
+    search_in_process, search_query, search_results, serialize_rows, tokenize, validate_bulk_items,
+)
+
+
+def async_database_url(database_url):
+    for sync_prefix, async_prefix in (('postgresql://', 'postgresql+asyncpg://'), ('sqlite://', 'sqlite+aiosqlite://')):
+        if database_url.startswith(sync_prefix):
+            return async_prefix + database_url[len(sync_prefix):]
+    return database_url
+
+
+DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL') or async_database_url(
+    os.environ.get('DATABASE_URL', 'postgresql://postgres:12345678@db:5432/aipos')
+)
+# Writes here must invalidate the Flask service's cached responses, which only
+# works through a cache both processes share (or with response caching turned off).
+if not flask_app.config['RESPONSE_CACHE_URL'] and flask_app.config['RESPONSE_CACHE_TTL'] > 0:
+    raise RuntimeError('async_rest_api requires RESPONSE_CACHE_URL shared with rest_api, or RESPONSE_CACHE_TTL=0')
+DEFAULT_PAGE_SIZE = flask_app.config['DEFAULT_PAGE_SIZE']
+MAX_PAGE_SIZE = flask_app.config['MAX_PAGE_SIZE']
+SEARCH_PAGE_SIZE = flask_app.config['SEARCH_PAGE_SIZE']
+STREAM_BATCH_SIZE = flask_app.config['STREAM_BATCH_SIZE']
+BULK_CHUNK_SIZE = flask_app.config['BULK_CHUNK_SIZE']
+
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+MODELS = {'author': Author, 'category': Category, 'publisher': Publisher, 'book': Book}
+COLLECTIONS = {
+    'author': (NAMED_FIELDS[Author], ['id', 'name'], NAMED_FILTERS[Author], None),
+    'category': (NAMED_FIELDS[Category], ['id', 'name'], NAMED_FILTERS[Category], None),
+    'publisher': (NAMED_FIELDS[Publisher], ['id', 'name'], NAMED_FILTERS[Publisher], None),
+    'book': (BOOK_FIELDS, BOOK_DEFAULT_FIELDS, BOOK_FILTERS, BOOK_JOINS),
+}
+
+
+def dumps(data):
+    # Same bytes as Flask's jsonify, so both variants hand out the same ETags.
+    return dumps_json(data) + '\n'
+
+
+def json_response(data, status=200, headers=None):
+    return Response(dumps(data), status_code=status, headers=headers, media_type='application/json')
+
+
+def conditional_response(request, data, headers=None):
+    body = dumps(data).encode()
+    headers = dict(headers or {})
+    headers['ETag'] = f'"{generate_etag(body)}"'
+    if parse_etags(request.headers.get('if-none-match')).contains_weak(generate_etag(body)):
+        return Response(status_code=304, headers=headers)
+    return Response(body, headers=headers, media_type='application/json')
+
+
+def check_if_match(request, representation):
+    if_match = parse_etags(request.headers.get('if-match'))
+    if if_match and not if_match.contains(generate_etag(dumps(representation).encode())):
+        raise HTTPException(412, 'Resource has been modified')
+
+
+def int_arg(request, name, default=None):
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def requested_fields(request, columns, default_fields):
+    fields = request.query_params.get('fields')
+    if not fields:
+        return default_fields
+    fields = list(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in columns]
+    if unknown or not fields:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def wants_stream(request):
+    if request.query_params.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return wants_ndjson(request)
+
+
+def wants_ndjson(request):
+    accept = request.headers.get('accept', '')
+    return accept.split(',')[0].split(';')[0].strip() == 'application/x-ndjson'
+
+
+def stream_rows(request, query, fields):
+    ndjson = wants_ndjson(request)
+
+    async def generate():
+        async with Session() as session:
+            result = await session.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+            if ndjson:
+                async for rows in result.partitions():
+                    yield ''.join(dumps_json(row) + '\n' for row in serialize_rows(rows, fields, 1))
+                return
+            yield '['
+            separator = ''
+            async for rows in result.partitions():
+                yield separator + dumps_json(serialize_rows(rows, fields, 1))[1:-1]
+                separator = ','
+            yield ']\n'
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson' if ndjson else 'application/json')
+
+
+async def list_entities(request, Model, columns, default_fields, filters, joins=None):
+    fields = requested_fields(request, columns, default_fields)
+    after = int_arg(request, 'after')
+
+    query = select(Model.id, *(columns[field] for field in fields))
+    for field, relationship in (joins or {}).items():
+        if field in fields:
+            query = query.join(relationship)
+    for name, (condition, cast) in filters.items():
+        value = request.query_params.get(name)
+        if value is not None:
+            try:
+                query = query.where(condition(cast(value)))
+            except ValueError:
+                raise HTTPException(400, f'Invalid value for {name}')
+    if after is not None:
+        query = query.where(Model.id > after)
+    query = query.order_by(Model.id)
+
+    if wants_stream(request):
+        limit = int_arg(request, 'limit')
+        if limit is not None:
+            query = query.limit(max(1, limit))
+        return stream_rows(request, query, fields)
+
+    limit = max(1, min(int_arg(request, 'limit', DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+    async with Session() as session:
+        rows = (await session.execute(query.limit(limit + 1))).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    headers = {}
+    if has_more:
+        cursor = rows[-1][0]
+        args = dict(request.query_params)
+        args.update(after=cursor, limit=limit)
+        headers['Link'] = f'<{request.url.path}?{urlencode(args, safe=",")}>; rel="next"'
+        headers['X-Next-Cursor'] = str(cursor)
+    return conditional_response(request, serialize_rows(rows, fields, 1), headers)
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPException(400, 'Expected a JSON body')
+
+
+def collection_endpoint(entity):
+    Model = MODELS[entity]
+
+    async def endpoint(request):
+        if request.method == 'POST':
+            data = await read_json(request)
+            try:
+                new_entity = Model(**{field: data[field] for field in DETAIL_FIELDS[Model] if field != 'id'})
+            except (KeyError, TypeError):
+                raise HTTPException(400, 'Missing fields')
+            async with Session() as session:
+                session.add(new_entity)
+                await session.commit()
+            return json_response({'message': f'{Model.__name__} created successfully'}, 201)
+
+        return await list_entities(request, Model, *COLLECTIONS[entity])
+    return endpoint
+
+
+def detail_endpoint(entity):
+    Model = MODELS[entity]
+    fields = DETAIL_FIELDS[Model]
+
+    async def endpoint(request):
+        id = request.path_params['id']
+        async with Session() as session:
+            item = await session.get(Model, id)
+            if item is None:
+                raise HTTPException(404, f'{Model.__name__} not found')
+
+            representation = {field: getattr(item, field) for field in fields}
+            if request.method == 'GET':
+                return conditional_response(request, representation)
+            check_if_match(request, representation)
+
+            if request.method == 'PUT':
+                data = await read_json(request)
+                try:
+                    for field in fields[1:]:
+                        setattr(item, field, data[field])
+                except (KeyError, TypeError):
+                    raise HTTPException(400, 'Missing fields')
+                await session.commit()
+                return json_response({'message': f'{Model.__name__} updated successfully'})
+
+            dependent = BULK_DEPENDENTS.get(Model)
+            if dependent is not None:
+                await session.execute(delete(Book).where(dependent == id))
+            await session.execute(delete(Model).where(Model.id == id))
+            await session.commit()
+            return json_response({'message': f'{Model.__name__} deleted successfully'})
+    return endpoint
+
+
+async def existing_ids(session, Model, ids):
+    found = set()
+    for chunk in chunked(list(ids), BULK_CHUNK_SIZE):
+        found.update(await session.scalars(select(Model.id).where(Model.id.in_(chunk))))
+    return found
+
+
+async def bulk_upsert(session, Model, items):
+    results, valid = validate_bulk_items(Model, items)
+    found = await existing_ids(session, Model, {row['id'] for row, _ in valid if 'id' in row})
+    plan = plan_bulk_upsert(Model, results, valid, found)
+    if plan is None:
+        return json_response(results, 400)
+    inserts, updates = plan
+
+    generated = [(row, result) for row, result in inserts if 'id' not in row]
+    explicit = [row for row, _ in inserts if 'id' in row]
+    try:
+        # Explicit ids go first and move the sequence past them, so that generated
+        # ids in the same batch cannot take an id a later item asks for.
+        if explicit:
+            await session.execute(insert(Model), explicit)
+            if engine.dialect.name == 'postgresql':
+                await session.execute(reset_id_sequence(Model))
+        if generated:
+            statement = insert(Model).returning(Model.id, sort_by_parameter_order=True)
+            new_ids = await session.scalars(statement, [row for row, _ in generated])
+            for (_, result), new_id in zip(generated, new_ids):
+                result['id'] = new_id
+        if updates:
+            await session.execute(update(Model), updates)
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        return json_response({'message': 'Bulk write rejected', 'error': str(e.orig)}, 409)
+    return json_response(results)
+
+
+async def bulk_delete(session, Model, ids):
+    if any(type(id) is not int for id in ids):
+        return json_response({'message': 'Expected a list of integer ids'}, 400)
+    found = await existing_ids(session, Model, set(ids))
+    dependent = BULK_DEPENDENTS.get(Model)
+    for chunk in chunked(list(found), BULK_CHUNK_SIZE):
+        if dependent is not None:
+            await session.execute(delete(Book).where(dependent.in_(chunk)))
+        await session.execute(delete(Model).where(Model.id.in_(chunk)))
+    await session.commit()
+    return json_response([
+        {'index': index, 'id': id, 'status': 'deleted' if id in found else 'not_found'}
+        for index, id in enumerate(ids)
+    ])
+
+
+def bulk_endpoint(entity):
+    Model = MODELS[entity]
+
+    async def endpoint(request):
+        try:
+            items = await request.json()
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            return json_response({'message': 'Expected a JSON array'}, 400)
+        async with Session() as session:
+            if request.method == 'DELETE':
+                return await bulk_delete(session, Model, items)
+            return await bulk_upsert(session, Model, items)
+    return endpoint
+
+
+async def collection_rows(session, id_column, columns, fields, joins=None):
+    query = select(*(columns[field] for field in fields))
+    for field, relationship in (joins or {}).items():
+        if field in fields:
+            query = query.join(relationship)
+    return serialize_rows(await session.execute(query.order_by(id_column)), fields)
+
+
+async def bundle(request):
+    include = request.query_params.get('include', ','.join(BUNDLE_COLLECTIONS))
+    names = [name.strip() for name in include.split(',') if name.strip()]
+    unknown = [name for name in names if name not in BUNDLE_COLLECTIONS]
+    if unknown or not names:
+        raise HTTPException(400, f"Unknown collections: {', '.join(unknown)}")
+    async with Session() as session:
+        data = {name: await collection_rows(session, *BUNDLE_COLLECTIONS[name]) for name in names}
+    return conditional_response(request, data)
+
+
+def search_fallback(tokens, phrase, types, limit, offset):
+    # Without PostgreSQL the in-process index is loaded through the Flask app's synchronous engine.
+    with flask_app.app_context():
+        return search_in_process(tokens, phrase, types, limit, offset)
+
+
+async def search(request):
+    phrase = request.query_params.get('q', '').strip().lower()
+    tokens = tokenize(phrase)
+    if not tokens:
+        raise HTTPException(400, 'Missing search query')
+    types = [type.strip() for type in request.query_params.get('type', ','.join(SEARCH_TYPES)).split(',')
+             if type.strip()]
+    unknown = [type for type in types if type not in SEARCH_TYPES]
+    if unknown or not types:
+        raise HTTPException(400, f"Unknown types: {', '.join(unknown)}")
+    limit = max(1, min(int_arg(request, 'limit', SEARCH_PAGE_SIZE), MAX_PAGE_SIZE))
+    offset = max(0, int_arg(request, 'offset', 0))
+
+    if engine.dialect.name == 'postgresql':
+        async with Session() as session:
+            results = search_results(await session.execute(search_query(tokens, phrase, types, limit + 1, offset)))
+    else:
+        results = await run_in_threadpool(search_fallback, tokens, phrase, set(types), limit + 1, offset)
+
+    headers = {}
+    if len(results) > limit:
+        args = dict(request.query_params)
+        args.update(offset=offset + limit, limit=limit)
+        headers['Link'] = f'<{request.url.path}?{urlencode(args, safe=",")}>; rel="next"'
+    return conditional_response(request, results[:limit], headers)
+
+
+def invalidating(entity, endpoint):
+    """Bump the entity generations after a successful write, like the Flask app's cached() decorator."""
+    async def wrapper(request):
+        response = await endpoint(request)
+        # Starlette answers HEAD on every GET route; only real writes bump generations.
+        if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+            await run_in_threadpool(invalidate, CACHE_WRITES[entity])
+        return response
+    return wrapper
+
+
+async def http_error(request, exc):
+    return json_response({'message': exc.detail}, exc.status_code)
+
+
+routes = [Route('/bundle', bundle, methods=['GET']), Route('/search', search, methods=['GET'])]
+for entity in MODELS:
+    routes += [
+        Route(f'/{entity}', invalidating(entity, collection_endpoint(entity)), methods=['GET', 'POST'],
+              name=f'{entity}_collection'),
+        Route(f'/{entity}/bulk', invalidating(entity, bulk_endpoint(entity)), methods=['POST', 'DELETE'],
+              name=f'{entity}_bulk'),
+        Route(f'/{entity}/{{id:int}}', invalidating(entity, detail_endpoint(entity)), methods=['GET', 'PUT', 'DELETE'],
+              name=f'{entity}_detail'),
+    ]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+app = Starlette(routes=routes, exception_handlers={HTTPException: http_error}, lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5001)))
@@ -1,18 +1,114 @@
 from flask import Flask, render_template, request, redirect, url_for
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
 import requests
 import os
+import threading
+import time
 
 app = Flask(__name__)
 API_BASE_URL = os.environ.get('API_BASE_URL', 'http://rest_api:5001')
+API_POOL_SIZE = int(os.environ.get('API_POOL_SIZE', 20))
+API_TIMEOUT = float(os.environ.get('API_TIMEOUT', 5))
+API_WORKERS = int(os.environ.get('API_WORKERS', 8))
+API_CACHE_SIZE = int(os.environ.get('API_CACHE_SIZE', 64))
+API_CACHE_TTL = float(os.environ.get('API_CACHE_TTL', 60))
+REFERENCE_ENTITIES = ('author', 'category', 'publisher')
+
+# One keep-alive connection pool to the REST API shared by all requests,
+# and a worker pool to issue independent upstream calls in parallel.
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE)
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+executor = ThreadPoolExecutor(max_workers=API_WORKERS)
+
+
+def get_bundle(*entities):
+    response = session.get(f'{API_BASE_URL}/bundle', params={'include': ','.join(entities)}, timeout=API_TIMEOUT)
+    return response.json()
+
+
+class ReferenceCache:
+    """TTL + LRU cache of upstream JSON keyed by the entities it contains; stale entries keep their ETag."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, data, etag):
+        with self.lock:
+            self.entries[key] = {'data': data, 'etag': etag, 'expires': time.monotonic() + self.ttl}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def purge(self, entity):
+        with self.lock:
+            for key in [key for key in self.entries if entity in key]:
+                del self.entries[key]
+
+
+reference_cache = ReferenceCache(API_CACHE_SIZE, API_CACHE_TTL)
+
+
+def get_reference(*entities):
+    """Like get_bundle for rarely changing lists: served from cache, revalidated with If-None-Match once stale."""
+    entry = reference_cache.get(entities)
+    if entry is not None and entry['expires'] > time.monotonic():
+        return entry['data']
+
+    headers = {'If-None-Match': entry['etag']} if entry is not None and entry['etag'] else {}
+    try:
+        response = session.get(
+            f'{API_BASE_URL}/bundle', params={'include': ','.join(entities)}, headers=headers, timeout=API_TIMEOUT
+        )
+        if response.status_code == 304 and entry is not None:
+            data = entry['data']
+        else:
+            response.raise_for_status()
+            data = response.json()
+    except requests.RequestException:
+        # Error responses are never cached; a stale copy beats failing the page while the API recovers.
+        if entry is None:
+            raise
+        return entry['data']
+    reference_cache.put(entities, data, response.headers.get('ETag', entry and entry['etag']))
+    return data
+
+
+def get_one(entity, id):
+    return session.get(f'{API_BASE_URL}/{entity}/{id}', timeout=API_TIMEOUT).json()
+
+
+def fan_out(calls):
+    """Run independent upstream calls concurrently: {name: (func, *args)} -> {name: result}."""
+    futures = {name: executor.submit(*call) for name, call in calls.items()}
+    return {name: future.result() for name, future in futures.items()}
 
 
 @app.route('/')
 def index():
+    results = fan_out({
+        'books': (get_bundle, 'book'),
+        'references': (get_reference, *REFERENCE_ENTITIES),
+    })
+    references = results['references']
     data = {
-        'books': requests.get(f'{API_BASE_URL}/book').json(),
-        'authors': requests.get(f'{API_BASE_URL}/author').json(),
-        'categories': requests.get(f'{API_BASE_URL}/category').json(),
-        'publishers': requests.get(f'{API_BASE_URL}/publisher').json(),
+        'books': results['books']['book'],
+        'authors': references['author'],
+        'categories': references['category'],
+        'publishers': references['publisher'],
     }
     return render_template('index.html', **data)
 
@@ -37,24 +133,32 @@ def edit_or_add_entity(entity, id=None):
             data = {'name': request.form['name']}
 
         url = f'{API_BASE_URL}/{entity}/{id}' if is_edit else f'{API_BASE_URL}/{entity}'
-        requests.post(url, json=data) if not is_edit else requests.put(url, json=data)
+        if is_edit:
+            session.put(url, json=data, timeout=API_TIMEOUT)
+        else:
+            session.post(url, json=data, timeout=API_TIMEOUT)
+        reference_cache.purge(entity)
         return redirect(url_for('index'))
 
+    calls = {}
     if is_edit:
-        item = requests.get(f'{API_BASE_URL}/{entity}/{id}').json()
-    else:
-        item = {}
+        calls['item'] = (get_one, entity, id)
+    if entity == 'book':
+        calls['options'] = (get_reference, *REFERENCE_ENTITIES)
+    results = fan_out(calls)
+    item = results.get('item', {})
+    options = results.get('options', {})
 
     fields = []
     if entity == 'book':
         fields.extend([
             {'id': 'title', 'name': 'title', 'label': 'Title', 'type': 'text', 'value': item.get('title', '')},
             {'id': 'author_id', 'name': 'author_id', 'label': 'Author', 'type': 'select',
-             'options': requests.get(f'{API_BASE_URL}/author').json(), 'value': item.get('author_id')},
+             'options': options['author'], 'value': item.get('author_id')},
             {'id': 'category_id', 'name': 'category_id', 'label': 'Category', 'type': 'select',
-             'options': requests.get(f'{API_BASE_URL}/category').json(), 'value': item.get('category_id')},
+             'options': options['category'], 'value': item.get('category_id')},
             {'id': 'publisher_id', 'name': 'publisher_id', 'label': 'Publisher', 'type': 'select',
-             'options': requests.get(f'{API_BASE_URL}/publisher').json(), 'value': item.get('publisher_id')}
+             'options': options['publisher'], 'value': item.get('publisher_id')}
         ])
     else:
         fields = [{'id': 'name', 'name': 'name', 'label': 'Name', 'type': 'text', 'value': item.get('name', '')}]
@@ -64,7 +168,8 @@ def edit_or_add_entity(entity, id=None):
 
 @app.route('/delete/<entity>/<int:id>', methods=['POST'])
 def delete_entity(entity, id):
-    requests.delete(f'{API_BASE_URL}/{entity}/{id}')
+    session.delete(f'{API_BASE_URL}/{entity}/{id}', timeout=API_TIMEOUT)
+    reference_cache.purge(entity)
     return redirect(url_for('index'))
 
 
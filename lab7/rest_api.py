@@ -1,41 +1,761 @@
-from flask import Flask, jsonify, request, abort
+from flask import Flask, Response, jsonify, request, abort, url_for, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, case, delete, event, func, insert, literal, literal_column, select, text, union_all, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.http import generate_etag
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from functools import lru_cache, wraps
+from itertools import islice
+from urllib.parse import urlencode
+import base64
+import heapq
+import json
 import os
+import re
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Keep in sync with lab_6/app.py: each lab is built as a separate image, so the helper is copied.
+def engine_options(database_url):
+    """SQLAlchemy engine settings from DB_* environment variables (pooling is left to SQLite's defaults)."""
+    if database_url.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes'),
+    }
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+    if statement_timeout and database_url.startswith('postgresql+asyncpg'):
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(statement_timeout)}}
+    elif statement_timeout and database_url.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with orjson underneath when JSON_BACKEND allows it; same key order and output."""
+
+    def __init__(self, app):
+        super().__init__(app)
+        backend = app.config['JSON_BACKEND']
+        if backend == 'orjson' and orjson is None:
+            raise RuntimeError('JSON_BACKEND=orjson requires the orjson package')
+        self.use_orjson = orjson is not None and backend in ('auto', 'orjson')
+
+    def dumps(self, obj, **kwargs):
+        if self.use_orjson:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS).decode()
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if not self.use_orjson:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'postgresql://postgres:12345678@db:5432/aipos')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['DEFAULT_PAGE_SIZE'] = int(os.environ.get('DEFAULT_PAGE_SIZE', 100))
+app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+app.config['STREAM_BATCH_SIZE'] = int(os.environ.get('STREAM_BATCH_SIZE', 500))
+app.config['BULK_CHUNK_SIZE'] = int(os.environ.get('BULK_CHUNK_SIZE', 1000))
+app.config['RESPONSE_CACHE_URL'] = os.environ.get('RESPONSE_CACHE_URL')
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+app.config['RESPONSE_CACHE_TTL'] = float(os.environ.get('RESPONSE_CACHE_TTL', 30))
+app.config['JSON_BACKEND'] = os.environ.get('JSON_BACKEND', 'auto')
+app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+app.config['SEARCH_INDEX_TTL'] = float(os.environ.get('SEARCH_INDEX_TTL', 300))
+app.json = FastJSONProvider(app)
 db = SQLAlchemy(app)
 
 
+def search_indexes(table, column):
+    """PostgreSQL GIN indexes for substring filters (pg_trgm) and full-text search (to_tsvector).
+
+    Other dialects skip them and make do with the btree index on the column.
+    """
+    return tuple(index.ddl_if(dialect='postgresql') for index in (
+        db.Index(f'ix_{table}_{column}_trgm', column,
+                 postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}),
+        db.Index(f'ix_{table}_{column}_fts', text(f"to_tsvector('simple', {column})"), postgresql_using='gin'),
+    ))
+
+
+event.listen(
+    db.metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'),
+)
+
+
 class Author(db.Model):
+    __table_args__ = search_indexes('author', 'name')
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
 
 
 class Category(db.Model):
+    __table_args__ = search_indexes('category', 'name')
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
 
 
 class Publisher(db.Model):
+    __table_args__ = search_indexes('publisher', 'name')
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
 
 
 class Book(db.Model):
+    __table_args__ = search_indexes('book', 'title')
+
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(100), nullable=False)
-    author_id = db.Column(db.Integer, db.ForeignKey('author.id'), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
-    publisher_id = db.Column(db.Integer, db.ForeignKey('publisher.id'), nullable=False)
+    title = db.Column(db.String(100), nullable=False, index=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('author.id'), nullable=False, index=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False, index=True)
+    publisher_id = db.Column(db.Integer, db.ForeignKey('publisher.id'), nullable=False, index=True)
 
     author = db.relationship('Author', backref='books')
     category = db.relationship('Category', backref='books')
     publisher = db.relationship('Publisher', backref='books')
 
 
+NAMED_FIELDS = {
+    Model: {'id': Model.id, 'name': Model.name} for Model in (Author, Category, Publisher)
+}
+
+
+def equals(column):
+    return lambda value: column == value
+
+
+def prefix(column):
+    return lambda value: column.startswith(value, autoescape=True)
+
+
+NAMED_FILTERS = {
+    Model: {'name': (equals(Model.name), str), 'name_prefix': (prefix(Model.name), str)}
+    for Model in (Author, Category, Publisher)
+}
+
+BOOK_FIELDS = {
+    'id': Book.id,
+    'title': Book.title,
+    'author': Author.name,
+    'category': Category.name,
+    'publisher': Publisher.name,
+    'author_id': Book.author_id,
+    'category_id': Book.category_id,
+    'publisher_id': Book.publisher_id,
+}
+BOOK_DEFAULT_FIELDS = ['id', 'title', 'author', 'category', 'publisher']
+BOOK_JOINS = {'author': Book.author, 'category': Book.category, 'publisher': Book.publisher}
+BOOK_FILTERS = {
+    'title': (equals(Book.title), str),
+    'title_prefix': (prefix(Book.title), str),
+    'author_id': (equals(Book.author_id), int),
+    'category_id': (equals(Book.category_id), int),
+    'publisher_id': (equals(Book.publisher_id), int),
+}
+
+
+DETAIL_FIELDS = {
+    Author: ('id', 'name'),
+    Category: ('id', 'name'),
+    Publisher: ('id', 'name'),
+    Book: ('id', 'title', 'author_id', 'category_id', 'publisher_id'),
+}
+
+
+def dumps_json(data):
+    """Compact JSON text with the same bytes jsonify produces (minus the trailing newline)."""
+    return app.json.dumps(data, separators=(',', ':'))
+
+
+@lru_cache(maxsize=256)
+def row_serializer(fields, offset=0):
+    """Build a row-tuple-to-dict function for fields, which start at column offset of each row."""
+    return lambda row: dict(zip(fields, row[offset:]))
+
+
+def serialize_rows(rows, fields, offset=0):
+    return list(map(row_serializer(tuple(fields), offset), rows))
+
+
+def requested_fields(columns, default_fields):
+    fields = request.args.get('fields')
+    if not fields:
+        return default_fields
+    fields = list(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in columns]
+    if unknown or not fields:
+        abort(400, description=f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def wants_stream():
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+def stream_rows(query, fields):
+    ndjson = request.accept_mimetypes.best == 'application/x-ndjson'
+    statement = query.execution_options(stream_results=True, yield_per=app.config['STREAM_BATCH_SIZE'])
+
+    # Serialize one yield_per partition per chunk instead of one row at a time.
+    def generate():
+        partitions = db.session.execute(statement).partitions()
+        if ndjson:
+            for rows in partitions:
+                yield ''.join(dumps_json(row) + '\n' for row in serialize_rows(rows, fields, 1))
+            return
+        yield '['
+        separator = ''
+        for rows in partitions:
+            yield separator + dumps_json(serialize_rows(rows, fields, 1))[1:-1]
+            separator = ','
+        yield ']\n'
+
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+
+def list_entities(id_column, columns, default_fields, filters, joins=None):
+    fields = requested_fields(columns, default_fields)
+    after = request.args.get('after', type=int)
+
+    query = select(id_column, *(columns[field] for field in fields))
+    for field, relationship in (joins or {}).items():
+        if field in fields:
+            query = query.join(relationship)
+    for name, (condition, cast) in filters.items():
+        value = request.args.get(name)
+        if value is not None:
+            try:
+                query = query.where(condition(cast(value)))
+            except ValueError:
+                abort(400, description=f"Invalid value for {name}")
+    if after is not None:
+        query = query.where(id_column > after)
+    query = query.order_by(id_column)
+
+    if wants_stream():
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            query = query.limit(max(1, limit))
+        return stream_rows(query, fields)
+
+    limit = request.args.get('limit', app.config['DEFAULT_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+    rows = db.session.execute(query.limit(limit + 1)).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    response = jsonify(serialize_rows(rows, fields, 1))
+    if has_more:
+        cursor = rows[-1][0]
+        args = request.args.to_dict()
+        args.update(after=cursor, limit=limit)
+        response.headers['Link'] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+        response.headers['X-Next-Cursor'] = str(cursor)
+    return response
+
+
+BUNDLE_COLLECTIONS = {
+    'book': (Book.id, BOOK_FIELDS, BOOK_DEFAULT_FIELDS, BOOK_JOINS),
+    'author': (Author.id, NAMED_FIELDS[Author], ['id', 'name'], None),
+    'category': (Category.id, NAMED_FIELDS[Category], ['id', 'name'], None),
+    'publisher': (Publisher.id, NAMED_FIELDS[Publisher], ['id', 'name'], None),
+}
+
+
+def collection_rows(id_column, columns, fields, joins=None):
+    query = select(*(columns[field] for field in fields))
+    for field, relationship in (joins or {}).items():
+        if field in fields:
+            query = query.join(relationship)
+    return serialize_rows(db.session.execute(query.order_by(id_column)), fields)
+
+
+def detail_representation(Model, id):
+    fields = DETAIL_FIELDS[Model]
+    row = db.session.execute(select(*(getattr(Model, field) for field in fields)).where(Model.id == id)).first()
+    if row is None:
+        abort(404)
+    return row_serializer(fields)(row)
+
+
+BULK_FIELDS = {
+    Author: {'name': str},
+    Category: {'name': str},
+    Publisher: {'name': str},
+    Book: {'title': str, 'author_id': int, 'category_id': int, 'publisher_id': int},
+}
+BULK_DEPENDENTS = {
+    Author: Book.author_id,
+    Category: Book.category_id,
+    Publisher: Book.publisher_id,
+}
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def existing_ids(Model, ids):
+    found = set()
+    for chunk in chunked(list(ids), app.config['BULK_CHUNK_SIZE']):
+        found.update(db.session.scalars(select(Model.id).where(Model.id.in_(chunk))))
+    return found
+
+
+def validate_bulk_item(item, fields):
+    if not isinstance(item, dict):
+        return None, 'Item must be an object'
+    row = {}
+    if 'id' in item:
+        if type(item['id']) is not int:
+            return None, 'Invalid value for id'
+        row['id'] = item['id']
+    for name, kind in fields.items():
+        if name not in item:
+            continue
+        if type(item[name]) is not kind:
+            return None, f'Invalid value for {name}'
+        row[name] = item[name]
+    unknown = set(item) - set(fields) - {'id'}
+    if unknown:
+        return None, f"Unknown fields: {', '.join(sorted(unknown))}"
+    return row, None
+
+
+def validate_bulk_items(Model, items):
+    fields = BULK_FIELDS[Model]
+    results, valid = [], []
+    for index, item in enumerate(items):
+        row, error = validate_bulk_item(item, fields)
+        result = {'index': index, 'id': None if row is None else row.get('id')}
+        if error:
+            result.update(status='error', error=error)
+        else:
+            valid.append((row, result))
+        results.append(result)
+    return results, valid
+
+
+def plan_bulk_upsert(Model, results, valid, found):
+    """Split the valid rows into inserts and updates, or return None when the batch is rejected.
+
+    A batch is written all or nothing, so when any item fails the others are reported as skipped.
+    """
+    fields = BULK_FIELDS[Model]
+    inserts, updates = [], []
+    for row, result in valid:
+        if row.get('id') in found:
+            if len(row) == 1:
+                result.update(status='error', error='No fields to update')
+            else:
+                updates.append((row, result))
+        else:
+            missing = [name for name in fields if name not in row]
+            if missing:
+                result.update(status='error', error=f"Missing fields: {', '.join(missing)}")
+            else:
+                inserts.append((row, result))
+    if any('error' in result for result in results):
+        for result in results:
+            result.setdefault('status', 'skipped')
+        return None
+    for _, result in inserts:
+        result['status'] = 'created'
+    for _, result in updates:
+        result['status'] = 'updated'
+    return inserts, [row for row, _ in updates]
+
+
+def reset_id_sequence(Model):
+    table = Model.__tablename__
+    return text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))")
+
+
+def bulk_upsert(Model, items):
+    results, valid = validate_bulk_items(Model, items)
+    found = existing_ids(Model, {row['id'] for row, _ in valid if 'id' in row})
+    plan = plan_bulk_upsert(Model, results, valid, found)
+    if plan is None:
+        return jsonify(results), 400
+    inserts, updates = plan
+
+    generated = [(row, result) for row, result in inserts if 'id' not in row]
+    explicit = [row for row, _ in inserts if 'id' in row]
+    try:
+        # Explicit ids go first and move the sequence past them, so that generated
+        # ids in the same batch cannot take an id a later item asks for.
+        if explicit:
+            db.session.execute(insert(Model), explicit)
+            if db.engine.dialect.name == 'postgresql':
+                db.session.execute(reset_id_sequence(Model))
+        if generated:
+            # Batched executemany gives no ordering guarantee on its own; this keeps
+            # RETURNING rows in parameter order without per-row round trips.
+            statement = insert(Model).returning(Model.id, sort_by_parameter_order=True)
+            new_ids = db.session.scalars(statement, [row for row, _ in generated])
+            for (_, result), new_id in zip(generated, new_ids):
+                result['id'] = new_id
+        if updates:
+            db.session.execute(update(Model), updates)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        return jsonify({'message': 'Bulk write rejected', 'error': str(e.orig)}), 409
+    return jsonify(results), 200
+
+
+def bulk_delete(Model, ids):
+    if any(type(id) is not int for id in ids):
+        return jsonify({'message': 'Expected a list of integer ids'}), 400
+    found = existing_ids(Model, set(ids))
+    targets = list(found)
+    dependent = BULK_DEPENDENTS.get(Model)
+    for chunk in chunked(targets, app.config['BULK_CHUNK_SIZE']):
+        if dependent is not None:
+            db.session.execute(delete(Book).where(dependent.in_(chunk)))
+        db.session.execute(delete(Model).where(Model.id.in_(chunk)))
+    db.session.commit()
+    return jsonify([
+        {'index': index, 'id': id, 'status': 'deleted' if id in found else 'not_found'}
+        for index, id in enumerate(ids)
+    ]), 200
+
+
+def bulk_entities(Model):
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        return jsonify({'message': 'Expected a JSON array'}), 400
+    if request.method == 'DELETE':
+        return bulk_delete(Model, items)
+    return bulk_upsert(Model, items)
+
+
+class LRUCache:
+    """In-process response cache: least recently used entries go first, all expire after their TTL."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_counters(self, keys):
+        with self.lock:
+            return [self.counters.get(key, 0) for key in keys]
+
+    def incr(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+
+class RedisCache:
+    """The same interface on top of a Redis-compatible server, shared by every worker process.
+
+    Values are cached responses: (status, [(header, value), ...], body).
+    """
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    # Entries are stored as plain JSON rather than pickles: anyone able to write to
+    # the server must not be able to run code in the API workers.
+    def get(self, key):
+        value = self.client.get(key)
+        if value is None:
+            return None
+        status, headers, body = json.loads(value)
+        return status, [tuple(header) for header in headers], base64.b64decode(body)
+
+    def set(self, key, value, ttl):
+        status, headers, body = value
+        value = json.dumps([status, headers, base64.b64encode(body).decode('ascii')])
+        self.client.set(key, value, px=int(ttl * 1000))
+
+    def get_counters(self, keys):
+        return [int(value or 0) for value in self.client.mget(keys)]
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+def create_response_cache():
+    url = app.config['RESPONSE_CACHE_URL']
+    if url:
+        return RedisCache(url)
+    return LRUCache(app.config['RESPONSE_CACHE_SIZE'])
+
+
+response_cache = create_response_cache()
+
+# Which entity generations a cached read depends on, and which ones a write
+# to the entity bumps. Parent writes bump 'book' too: book listings embed
+# their names and deleting a parent deletes its books.
+CACHE_READS = {
+    'author': ('author',),
+    'category': ('category',),
+    'publisher': ('publisher',),
+    'book': ('book', 'author', 'category', 'publisher'),
+    'bundle': ('book', 'author', 'category', 'publisher'),
+    'search': ('book', 'author', 'category', 'publisher'),
+}
+CACHE_WRITES = {
+    'author': ('author', 'book'),
+    'category': ('category', 'book'),
+    'publisher': ('publisher', 'book'),
+    'book': ('book',),
+}
+
+
+def cache_key(entities):
+    generations = response_cache.get_counters([f'generation:{entity}' for entity in entities])
+    query = urlencode(sorted(request.args.items(multi=True)))
+    versions = '.'.join(map(str, generations))
+    return f'response:{versions}:{request.path}?{query}'
+
+
+def invalidate(entities):
+    for entity in entities:
+        response_cache.incr(f'generation:{entity}')
+
+
+def check_if_match(representation):
+    """Reject a write made against a stale copy of the resource (optimistic concurrency)."""
+    if not request.if_match:
+        return
+    etag = generate_etag(jsonify(representation).get_data())
+    if not request.if_match.contains(etag):
+        abort(412, description='Resource has been modified')
+
+
+def cached(entity):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # HEAD is served by the GET branch of every view, so it is a read here too.
+            if request.method in ('POST', 'PUT', 'DELETE'):
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code < 400:
+                    invalidate(CACHE_WRITES[entity])
+                return response
+            if wants_stream():
+                return view(*args, **kwargs)
+
+            key = cache_key(CACHE_READS[entity])
+            hit = response_cache.get(key)
+            if hit is not None:
+                status, headers, body = hit
+                response = app.response_class(body, status=status, headers=headers)
+                response.headers['X-Cache'] = 'HIT'
+                return response.make_conditional(request)
+
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.add_etag()
+                response_cache.set(
+                    key,
+                    (response.status_code, list(response.headers), response.get_data()),
+                    app.config['RESPONSE_CACHE_TTL'],
+                )
+            response.headers['X-Cache'] = 'MISS'
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+SEARCH_TYPES = {
+    'book': (Book, Book.title),
+    'author': (Author, Author.name),
+    'category': (Category, Category.name),
+    'publisher': (Publisher, Publisher.name),
+}
+TS_CONFIG = literal_column("'simple'")
+
+
+def tokenize(value):
+    return re.findall(r'\w+', value.lower())
+
+
+def search_query(tokens, phrase, types, limit, offset):
+    """Ranked full-text search backed by the to_tsvector GIN indexes; every term matches as a prefix."""
+    query = func.to_tsquery(TS_CONFIG, ' & '.join(f'{token}:*' for token in tokens))
+    selects = []
+    for type in types:
+        Model, column = SEARCH_TYPES[type]
+        vector = func.to_tsvector(TS_CONFIG, column)
+        selects.append(
+            select(
+                literal(type).label('type'), Model.id.label('id'), column.label('text'),
+                (func.ts_rank(vector, query) + case((func.lower(column).startswith(phrase, autoescape=True), 1.0), else_=0.0))
+                .label('score'),
+            ).where(vector.op('@@')(query))
+        )
+    matches = union_all(*selects).subquery()
+    return (
+        select(matches)
+        .order_by(matches.c.score.desc(), func.length(matches.c.text), matches.c.type, matches.c.id)
+        .limit(limit).offset(offset)
+    )
+
+
+def search_results(rows):
+    return [
+        {'type': type, 'id': id, 'text': text, 'score': round(score, 4)}
+        for type, id, text, score in rows
+    ]
+
+
+def search_postgres(tokens, phrase, types, limit, offset):
+    return search_results(db.session.execute(search_query(tokens, phrase, types, limit, offset)))
+
+
+class SearchIndex:
+    """In-process inverted index with prefix lookups for databases without full-text search.
+
+    Rebuilt from the database when a write bumps an entity generation or after SEARCH_INDEX_TTL.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.generations = None
+        self.built_at = 0
+        self.snapshot = ({}, {}, [], {}, [], [], [], {})
+
+    def refresh(self, generations):
+        with self.lock:
+            if generations == self.generations and time.monotonic() - self.built_at < self.ttl:
+                return
+            documents, postings, by_type = {}, {}, {}
+            for type, (Model, column) in SEARCH_TYPES.items():
+                for id, value in db.session.execute(select(Model.id, column)):
+                    key = (type, id)
+                    documents[key] = value
+                    by_type.setdefault(type, set()).add(key)
+                    for token in set(tokenize(value)):
+                        postings.setdefault(token, set()).add(key)
+            by_text = sorted((value.lower(), key) for key, value in documents.items())
+            # Ties within a score are broken by shorter text first, then by type and id.
+            ordered = sorted(documents, key=lambda key: (len(documents[key]), key))
+            self.snapshot = (
+                documents, postings, sorted(postings), by_type,
+                [text for text, _ in by_text], [key for _, key in by_text],
+                ordered, {key: index for index, key in enumerate(ordered)},
+            )
+            self.generations = generations
+            self.built_at = time.monotonic()
+
+    def search(self, tokens, phrase, types, limit, offset):
+        documents, postings, vocabulary, by_type, texts, text_keys, ordered, positions = self.snapshot
+        candidates = []
+        for token in tokens:
+            start = bisect_left(vocabulary, token)
+            end = start
+            while end < len(vocabulary) and vocabulary[end].startswith(token):
+                end += 1
+            if start == end:
+                return []
+            if end - start == 1:
+                candidates.append(postings[vocabulary[start]])
+            else:
+                candidates.append(set().union(*(postings[term] for term in vocabulary[start:end])))
+        # by_type only holds types that have rows, so compare against the full set of searchable types.
+        if set(types) != set(SEARCH_TYPES):
+            candidates.append(set().union(*(by_type.get(type, ()) for type in types)))
+        # Intersect the most selective sets first; everything below stays in set operations
+        # so that short, unselective typeahead prefixes do not score rows one by one.
+        candidates.sort(key=len)
+        keys = candidates[0].intersection(*candidates[1:])
+
+        # Score: 0.5 per matched term, another 0.5 when the term matches a whole word,
+        # and 1.0 when the text starts with the query.
+        exact_counts = Counter()
+        for token in tokens:
+            if token in postings:
+                exact_counts.update(keys & postings[token])
+        groups = {0: keys.difference(exact_counts)}
+        for key, count in exact_counts.items():
+            groups.setdefault(count, set()).add(key)
+        start = bisect_left(texts, phrase)
+        starts = keys.intersection(text_keys[start:bisect_left(texts, phrase + '\U0010ffff', start)])
+
+        tiers = {}
+        for count, group in groups.items():
+            base = 0.5 * len(tokens) + 0.5 * count
+            tiers.setdefault(base + 1.0, []).append(group & starts)
+            tiers.setdefault(base, []).append(group - starts)
+
+        results, wanted = [], offset + limit
+        for score in sorted(tiers, reverse=True):
+            tier = set().union(*tiers[score])
+            if len(tier) * 16 >= len(ordered):
+                # Dense tier: the first members in global order turn up almost immediately.
+                best = islice(filter(tier.__contains__, ordered), wanted - len(results))
+            else:
+                best = heapq.nsmallest(wanted - len(results), tier, key=positions.__getitem__)
+            for key in best:
+                results.append({'type': key[0], 'id': key[1], 'text': documents[key], 'score': score})
+            if len(results) >= wanted:
+                break
+        return results[offset:]
+
+
+search_index = SearchIndex(app.config['SEARCH_INDEX_TTL'])
+
+
+def search_in_process(tokens, phrase, types, limit, offset):
+    search_index.refresh(tuple(response_cache.get_counters([f'generation:{type}' for type in SEARCH_TYPES])))
+    return search_index.search(tokens, phrase, types, limit, offset)
+
+
 @app.route('/author', methods=['GET', 'POST'])
+@cached('author')
 def authors():
     if request.method == 'POST':
         data = request.json
@@ -44,11 +764,11 @@ def authors():
         db.session.commit()
         return jsonify({'message': 'Author created successfully'}), 201
 
-    authors = Author.query.all()
-    return jsonify([{'id': author.id, 'name': author.name} for author in authors])
+    return list_entities(Author.id, NAMED_FIELDS[Author], ['id', 'name'], NAMED_FILTERS[Author])
 
 
 @app.route('/category', methods=['GET', 'POST'])
+@cached('category')
 def categories():
     if request.method == 'POST':
         data = request.json
@@ -57,11 +777,11 @@ def categories():
         db.session.commit()
         return jsonify({'message': 'Category created successfully'}), 201
 
-    categories = Category.query.all()
-    return jsonify([{'id': category.id, 'name': category.name} for category in categories])
+    return list_entities(Category.id, NAMED_FIELDS[Category], ['id', 'name'], NAMED_FILTERS[Category])
 
 
 @app.route('/publisher', methods=['GET', 'POST'])
+@cached('publisher')
 def publishers():
     if request.method == 'POST':
         data = request.json
@@ -70,11 +790,11 @@ def publishers():
         db.session.commit()
         return jsonify({'message': 'Publisher created successfully'}), 201
 
-    publishers = Publisher.query.all()
-    return jsonify([{'id': publisher.id, 'name': publisher.name} for publisher in publishers])
+    return list_entities(Publisher.id, NAMED_FIELDS[Publisher], ['id', 'name'], NAMED_FILTERS[Publisher])
 
 
 @app.route('/book', methods=['GET', 'POST'])
+@cached('book')
 def books():
     if request.method == 'POST':
         data = request.json
@@ -88,103 +808,156 @@ def books():
         db.session.commit()
         return jsonify({'message': 'Book created successfully'}), 201
 
-    books = Book.query.all()
-    return jsonify([{
-        'id': book.id,
-        'title': book.title,
-        'author': book.author.name,
-        'category': book.category.name,
-        'publisher': book.publisher.name
-    } for book in books])
+    return list_entities(Book.id, BOOK_FIELDS, BOOK_DEFAULT_FIELDS, BOOK_FILTERS, BOOK_JOINS)
+
+
+@app.route('/bundle', methods=['GET'])
+@cached('bundle')
+def bundle():
+    include = request.args.get('include', ','.join(BUNDLE_COLLECTIONS))
+    names = [name.strip() for name in include.split(',') if name.strip()]
+    unknown = [name for name in names if name not in BUNDLE_COLLECTIONS]
+    if unknown or not names:
+        abort(400, description=f"Unknown collections: {', '.join(unknown)}")
+    return jsonify({name: collection_rows(*BUNDLE_COLLECTIONS[name]) for name in names})
+
+
+@app.route('/search', methods=['GET'])
+@cached('search')
+def search():
+    phrase = request.args.get('q', '').strip().lower()
+    tokens = tokenize(phrase)
+    if not tokens:
+        abort(400, description='Missing search query')
+    types = [type.strip() for type in request.args.get('type', ','.join(SEARCH_TYPES)).split(',') if type.strip()]
+    unknown = [type for type in types if type not in SEARCH_TYPES]
+    if unknown or not types:
+        abort(400, description=f"Unknown types: {', '.join(unknown)}")
+    limit = request.args.get('limit', app.config['SEARCH_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+    offset = max(0, request.args.get('offset', 0, type=int))
+
+    if db.engine.dialect.name == 'postgresql':
+        results = search_postgres(tokens, phrase, types, limit + 1, offset)
+    else:
+        results = search_in_process(tokens, phrase, set(types), limit + 1, offset)
+
+    response = jsonify(results[:limit])
+    if len(results) > limit:
+        args = request.args.to_dict()
+        args.update(offset=offset + limit, limit=limit)
+        response.headers['Link'] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+    return response
+
+
+@app.route('/author/bulk', methods=['POST', 'DELETE'])
+@cached('author')
+def authors_bulk():
+    return bulk_entities(Author)
+
+
+@app.route('/category/bulk', methods=['POST', 'DELETE'])
+@cached('category')
+def categories_bulk():
+    return bulk_entities(Category)
+
+
+@app.route('/publisher/bulk', methods=['POST', 'DELETE'])
+@cached('publisher')
+def publishers_bulk():
+    return bulk_entities(Publisher)
+
+
+@app.route('/book/bulk', methods=['POST', 'DELETE'])
+@cached('book')
+def books_bulk():
+    return bulk_entities(Book)
 
 
 @app.route('/book/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@cached('book')
 def book_detail(id):
-    book = Book.query.get_or_404(id)
-
+    representation = detail_representation(Book, id)
     if request.method == 'GET':
-        return jsonify({
-            'id': book.id,
-            'title': book.title,
-            'author_id': book.author_id,
-            'category_id': book.category_id,
-            'publisher_id': book.publisher_id
-        })
+        return jsonify(representation)
+    check_if_match(representation)
 
     if request.method == 'PUT':
         data = request.json
-        book.title = data['title']
-        book.author_id = data['author_id']
-        book.category_id = data['category_id']
-        book.publisher_id = data['publisher_id']
+        db.session.execute(update(Book).where(Book.id == id).values(
+            title=data['title'],
+            author_id=data['author_id'],
+            category_id=data['category_id'],
+            publisher_id=data['publisher_id']
+        ))
         db.session.commit()
         return jsonify({'message': 'Book updated successfully'}), 200
 
     if request.method == 'DELETE':
-        db.session.delete(book)
+        db.session.execute(delete(Book).where(Book.id == id))
         db.session.commit()
         return jsonify({'message': 'Book deleted successfully'}), 200
 
 
 @app.route('/author/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@cached('author')
 def author_detail(id):
-    author = Author.query.get_or_404(id)
-
+    representation = detail_representation(Author, id)
     if request.method == 'GET':
-        return jsonify({'id': author.id, 'name': author.name})
+        return jsonify(representation)
+    check_if_match(representation)
 
     if request.method == 'PUT':
         data = request.json
-        author.name = data['name']
+        db.session.execute(update(Author).where(Author.id == id).values(name=data['name']))
         db.session.commit()
         return jsonify({'message': 'Author updated successfully'}), 200
 
     if request.method == 'DELETE':
-        for book in author.books:
-            db.session.delete(book)
-        db.session.delete(author)
+        db.session.execute(delete(Book).where(Book.author_id == id))
+        db.session.execute(delete(Author).where(Author.id == id))
         db.session.commit()
         return jsonify({'message': 'Author deleted successfully'}), 200
 
 
 @app.route('/category/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@cached('category')
 def category_detail(id):
-    category = Category.query.get_or_404(id)
-
+    representation = detail_representation(Category, id)
     if request.method == 'GET':
-        return jsonify({'id': category.id, 'name': category.name})
+        return jsonify(representation)
+    check_if_match(representation)
 
     if request.method == 'PUT':
         data = request.json
-        category.name = data['name']
+        db.session.execute(update(Category).where(Category.id == id).values(name=data['name']))
         db.session.commit()
         return jsonify({'message': 'Category updated successfully'}), 200
 
     if request.method == 'DELETE':
-        for book in category.books:
-            db.session.delete(book)
-        db.session.delete(category)
+        db.session.execute(delete(Book).where(Book.category_id == id))
+        db.session.execute(delete(Category).where(Category.id == id))
         db.session.commit()
         return jsonify({'message': 'Category deleted successfully'}), 200
 
 
 @app.route('/publisher/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@cached('publisher')
 def publisher_detail(id):
-    publisher = Publisher.query.get_or_404(id)
-
+    representation = detail_representation(Publisher, id)
     if request.method == 'GET':
-        return jsonify({'id': publisher.id, 'name': publisher.name})
+        return jsonify(representation)
+    check_if_match(representation)
 
     if request.method == 'PUT':
         data = request.json
-        publisher.name = data['name']
+        db.session.execute(update(Publisher).where(Publisher.id == id).values(name=data['name']))
         db.session.commit()
         return jsonify({'message': 'Publisher updated successfully'}), 200
 
     if request.method == 'DELETE':
-        for book in publisher.books:
-            db.session.delete(book)
-        db.session.delete(publisher)
+        db.session.execute(delete(Book).where(Book.publisher_id == id))
+        db.session.execute(delete(Publisher).where(Publisher.id == id))
         db.session.commit()
         return jsonify({'message': 'Publisher deleted successfully'}), 200
 
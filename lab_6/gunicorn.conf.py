@@ -0,0 +1,13 @@
+import os
+
+# Production serving profile, loaded automatically by gunicorn from the
+# working directory. Each worker opens its own database pool, so keep
+# WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under max_connections.
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
@@ -0,0 +1,60 @@
+"""Add lookup indexes
+
+Revision ID: 5f1c2d7e9a40
+Revises: ab4d6c03e956
+Create Date: 2026-10-18 19:58:41.215306
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5f1c2d7e9a40'
+down_revision = 'ab4d6c03e956'
+branch_labels = None
+depends_on = None
+
+TRIGRAM_INDEXES = {
+    'author': 'name',
+    'category': 'name',
+    'publisher': 'name',
+    'book': 'title',
+}
+
+
+def upgrade():
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_book_author_id'), ['author_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_book_category_id'), ['category_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_book_publisher_id'), ['publisher_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_book_title'), ['title'], unique=False)
+
+    for table in ('author', 'category', 'publisher'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(batch_op.f(f'ix_{table}_name'), ['name'], unique=False)
+
+    # The btree indexes above only serve prefix LIKE under the C collation;
+    # on PostgreSQL trigram indexes cover prefix and substring matches alike.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, column in TRIGRAM_INDEXES.items():
+            op.create_index(
+                f'ix_{table}_{column}_trgm', table, [column], unique=False,
+                postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, column in TRIGRAM_INDEXES.items():
+            op.drop_index(f'ix_{table}_{column}_trgm', table_name=table)
+
+    for table in ('publisher', 'category', 'author'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table}_name'))
+
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_book_title'))
+        batch_op.drop_index(batch_op.f('ix_book_publisher_id'))
+        batch_op.drop_index(batch_op.f('ix_book_category_id'))
+        batch_op.drop_index(batch_op.f('ix_book_author_id'))
@@ -0,0 +1,43 @@
+"""Add full-text indexes
+
+Revision ID: 8b3e4f6a2c71
+Revises: 5f1c2d7e9a40
+Create Date: 2026-10-18 20:31:07.482915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3e4f6a2c71'
+down_revision = '5f1c2d7e9a40'
+branch_labels = None
+depends_on = None
+
+FULL_TEXT_INDEXES = {
+    'author': 'name',
+    'category': 'name',
+    'publisher': 'name',
+    'book': 'title',
+}
+
+
+def upgrade():
+    # Serves the lab7 /search endpoint; the expression has to match its
+    # to_tsvector('simple', ...) calls for the planner to use the index.
+    # Other databases fall back to the in-process search index.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, column in FULL_TEXT_INDEXES.items():
+        op.create_index(
+            f'ix_{table}_{column}_fts', table, [sa.text(f"to_tsvector('simple', {column})")],
+            unique=False, postgresql_using='gin',
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, column in FULL_TEXT_INDEXES.items():
+        op.drop_index(f'ix_{table}_{column}_fts', table_name=table)